@@ -1,8 +1,19 @@
 # pylint: disable-msg=C0103
 """
 SentinelAnomalyLookup: This package is developed for Microsoft Sentinel Anomaly lookup
+Members are imported on first access.
 """
 
 # __init__.py
-from .anomaly_lookup_view_helper import AnomalyLookupViewHelper
-from .anomaly_finder import AnomalyQueries, AnomalyFinder
+from SentinelUtils.lazy_import import lazy_exports
+
+_EXPORTS = {
+    'AnomalyLookupViewHelper': '.anomaly_lookup_view_helper',
+    'QueryTemplate': '.anomaly_finder',
+    'AnomalyQueries': '.anomaly_finder',
+    'AnomalyFinder': '.anomaly_finder',
+    'QueryCache': '.query_cache'
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
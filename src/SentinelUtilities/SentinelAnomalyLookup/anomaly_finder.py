@@ -5,18 +5,52 @@
 # --------------------------------------------------------------------------
 """
 Anomaly Finder module:
-This module has two classes: AnomalyQueries and AnomalyFinder
+This module has three classes: QueryTemplate, AnomalyQueries and AnomalyFinder
 """
 
 import copy
 import datetime as dt
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-from pandas.io.json import json_normalize
 from azure.loganalytics.models import QueryBody
 
+from SentinelUtils.instrumentation import Instrumentation
 from SentinelUtils.obfuscation_utility import ObfuscationUtility
+from SentinelUtils.query_result_decoder import QueryResultDecoder
+from SentinelExceptions import InputError
 from SentinelLog.log import Log
 from .anomaly_lookup_view_helper import AnomalyLookupViewHelper
+from .query_cache import QueryCache
+
+
+class QueryTemplate(): # pylint: disable=too-few-public-methods
+    """
+    A KQL template parsed once, so that formatting only joins
+    the literal parts with the field values.
+    Templates with format specs, conversions or positional fields fall back to str.format.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._parts = []
+        self._simple = True
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(text):
+            if format_spec or conversion or (field_name is not None and not field_name.isidentifier()):
+                self._simple = False
+            self._parts.append((literal, field_name))
+
+    def format(self, **kwargs):
+        """ fill in the template, same result as str.format """
+
+        if not self._simple:
+            return self.text.format(**kwargs)
+        return ''.join([literal if field_name is None else literal + format(kwargs[field_name], '')
+                        for literal, field_name in self._parts])
+
+    def __str__(self):
+        return self.text
 
 
 class AnomalyQueries(): # pylint: disable=too-few-public-methods
@@ -31,113 +65,335 @@ class AnomalyQueries(): # pylint: disable=too-few-public-methods
     # pylint: disable=line-too-long
     QUERIES['ISCATHEURISTIC'] = b'gAAAAABdNjkglsyzKMCUkIXq3aqcim0F70S86HfAqaiyNUIF0La2st1DkiQTFK_vqVIyxiY25i78FiT6y0yZG4YQmpAVVwRJ302KkeAPVq0mPPK1FKbRcnnqmIc1HOAycyv3dmDHDUG7-_b-wyy8IDneWYyTE3TxyLUcG3kJRTmQd_6-hLXfDUjctjm0VPrA9zcrN8Il1y-nq-4jOsFZbO0qvHZfnLBTwaf52hkXPqmkZN9Rz-deW6Q4VY_j7Vw7rRrXM5WxRchL2kJBhGOq-hM8A3W9AA7qHnkgVu2BOVEYZAT_EnHvks8YMcWP04WKs49Dw5Ga4UMqJeU4MJH8PKfNmn7zcuLwMA=='
     # pylint: disable=line-too-long
+    QUERIES['ISCATHEURISTICBATCH'] = b'gAAAAABq1RaiC7DmvgEWwj-4iwrXxC0UZ07QLgbtrYaxP0_vbsn1O9bJXGMRbHYtvGK-hWk12SXY3qkV0043VqkMbZNU19KGcC5bP7WBL7dPN6ueoyv4wUrQY7qZmDnqBGtISnid8sbinTUqLDL2IhRkT_vb54yQVrAxnXXdzye1AMsskuh_rQkjeiHecMaTUXjhP_xI-lcg'
+    # pylint: disable=line-too-long
     QUERIES['TIMESERIESANOMALYDETECTION'] = b'gAAAAABeNN8ojnOJUuvi1_FI8bqz200wGX1CPFnxU8FHDnwmFx7Ywm54WwbFXMWXVIpiLf9zjv5Fcl85wdyBdA6KS7_xph89Geb5CQOoqMGt_-syZ_KgE4CXQoCDCfWmCYXlx2zzIZX5g88SfVJeLmWbCUsk20KTO0Ecdt6TauIUuLkCh85v55_j8RSxXvwZy4y-WAate9hZh1xoRV5fjvq1_ox2V_qpJO-HpzdCuZGelMx3DkxL0PUy2_SXLZdaa5HLl0vM0IfmiDqIQgcxnjAEwk6GGezh3FvT43BCwO_HX5PHixCkqozeXzbsLuWxOMpoZ5I1174dVWK-8e9uiVvMfwyOqeC9tlKoAUXAEBsXS41kEbAMTwlK3VcCqq9iTfnW0jUkSlMV7P_JbWOVxErwC4DtIKP5d6AyNcqVhBlOYZwouqoY734vBhDsx95bzN2mwwL2-_Set_ksdoxTLlFVaWK9MY4tmBCsoQSVHrVuo00K1zPYIh43VgbVm6gFLs7kdjFDraMb5fjx0VxXQrkUkeO3xZ7i9caKl2ODpoVf2ahAPxqPTmHIG9bqQBb2SGu3PakxrRiRanOLY-pJ4eN54fQlYhk-O-1UwpUnna4WVMbqST4tFbEBCpr4IeGNqnaEeNccuHaWHDdjxIEt5sZ402LFJAV0HvMOxOVD3qUjUroHFysJrZXzYJF9HApBbtryokMjgh1YPGAwguniTTyUQolrV_1m54yhJLd7I-39MnBpfobO6sXAtZjPxZfoCCmiJta_JaAuj2sW-8goxU0NBWUxBsiEnPIrHyJKLiduavgID2UcHR4rhByyUg3EzbeKFO-WS-oIVXn0jFUfGjhOKc70Xc1R3L_vvGe2029AYkWmHb36yEJgVlVJ4YQ_7eMSjosZA6R97SDzYXCC1eOopH1hyexwvJwmlzP2gb3NcZ41WbmCTA7vYlT1uH4IqMiuvNWwkZ7MpPIccOnwFWkLFzh_BpgDfvnGy-loqaTNuuLUYzoAyhejzfBQPwG7AlPwH85pfNGarrz7z47uMYQE51-R2gxpDSmw3QvWacKIs3F2g94umQjXJkZ9otiNxPqZceKINig3pFj_SMRiQ1vXRNyKUM8BYptJJ7CFR5TI37lElejgoQBD3VQ7uyK_Ghz8M4cJG1P3ry9d8mk0-vwNClGkb4WGgLR69dPBSZM03uQ14oolEHxuwPQgBoLM-Rlu3YuGQBfbCtqtarLa8IwFBQcbA6WsKJ2dDnCcrRdCuMMTsKuJlSfoU-7jAOwVN-ISg8m47aWbJZtjAODzPxuv9KOQlTfApJcjla37UKKctce9kVkYeoqi6dJnSF9HLsfbRhSIf9bWKHue2ML20urH-0xhIDxvSA=='
     # pylint: disable=line-too-long
     QUERIES['TIMEWINDOWQUERY'] = b'gAAAAABdOjxI1Cq7frn_5Gj1l2vvA6Eu-a5qghqvRTBc8I9gWdcI8JiALXjpT7qJwf8ZBCKCrwYtMXY2-bp7Cj4jwYVXVDKmXRjoyz0xLbiVdCkIc07U2sNjpwzO1y1OvRr2apYv5Y9_yh_vOpqN4uv1WUezH_z1bXNCO-yI-LMIlidav4Xh5KwRtGBTnXGBk5YidPJVHfnZZGpCQ5w7g4t0ptoM5p6w_eXC8RZ82J3QLIVGtguWISFYweE5GWVJkkUXq3aq3n36uIFl2T3YllLUX2FytfOw_B8Xt1UrspWURfgDx1xqyCnqUEPG_EnO-TuGKFbMkh6AjpcduidHTuuS45YGatPvzRzyAzElLnbj7-s0gc-0POrUyiNaeTj_Tg0wTBsIJklL'
     # pylint: disable=line-too-long
+    QUERIES['ISENTITYINTABLEBATCH'] = b'gAAAAABq1Rlmyye5wVVzbBY9U64e1UU6HtljayLiHLpQVAKYEuhVD2_fxIPvp2kp5TaV_YoDPMiOM2FjhOaBzytgHiup3brp59pueCZ1aZhIr8NvaV7McpsKuCyLHG4ZHNfJGuOjpJDeiwpGjPnS-pThp7lYQr9g4rHr2V-vCn8YaZygE9yMI_MReF2XclqkDrQ4hag3Kwjo5rc_ZwJV-__ZkPUyxzbGPVm3dxXsEou_1NM_VJVUhD-aVuYdqLTI0md8ARDMx-rOAHe5Ioradknfb9wnQNnA6JOcVr16U-rOoX29JJx9gv4='
+    # pylint: disable=line-too-long
     QUERIES['ISENTITYINTABLE'] = b'gAAAAABdNkO8YYV6ElbBqI9qp0oLHLquoYJD_7umEu1sDgyHouYcN0jU6vlOPp8AN5lecaMvXPUqQ5ZiFw6393Z9l7kNOB7IMITURv59MZJxeEVpt5ud9F4ge-5JGge5k7ux2YU50z-u9djJYet2SO-n1MpD5xO14ODKtBPsr9guZ40wYJwMzwLCjDSpTXFnIDjYrXDhfU3D2YGc4jnrq2EePBUAPPKxnIXg7AtmnGm4Add1_aV-pDlHMXTn09Z3kvlUcHpHBw7g'
 
+    _TEMPLATES = {}
+    _TEMPLATES_LOCK = threading.Lock()
+
+    @staticmethod
+    def get_template(name):
+        """ get KQL as a QueryTemplate, decrypted once per process """
+
+        template = AnomalyQueries._TEMPLATES.get(name)
+        if template is None:
+            with AnomalyQueries._TEMPLATES_LOCK:
+                template = AnomalyQueries._TEMPLATES.get(name)
+                if template is None:
+                    obfuscate = ObfuscationUtility(AnomalyQueries.KEY)
+                    template = QueryTemplate(obfuscate.deobfuscate_text(AnomalyQueries.QUERIES[name]))
+                    AnomalyQueries._TEMPLATES[name] = template
+        return template
+
     @staticmethod
     def get_query(name):
         """ get KQL """
 
-        en_query = AnomalyQueries.QUERIES[name]
-        obfuscate = ObfuscationUtility(AnomalyQueries.KEY)
-        query = obfuscate.deobfuscate_text(en_query)
-        return query
+        return AnomalyQueries.get_template(name).text
 
 
 class AnomalyFinder():
     """
     This class provides process flow functions for anomaly lookup.
     Method - run is the main entry point.
+    get_timewindow bisects by default, timewindow_search='linear' keeps the bucket scan.
+    Per-table queries are sent concurrently, at most max_workers in flight;
+    errors are collected per table in table_errors and printed at the end of the run
+    instead of aborting it, unless every table probe fails (e.g. an expired token): then the error is raised.
+    The number of queries issued per table is kept in table_query_counts.
+    With batch_cat_heuristic, the categorical column test runs for up to
+    cat_heuristic_batch_size columns of a table in one query.
+    Table lists and schemas are served from query_cache, the process wide
+    QueryCache.shared() unless another cache is given.
+    Method - run_batch looks up many (entity, timestamp) pairs, sharing table discovery
+    and categorical columns, and probing up to entity_batch_size entities per table query.
     """
 
-    def __init__(self, workspace_id, la_data_client):
+    TIMEWINDOW_SEARCHES = {'linear': '_linear_first_bucket', 'bisect': '_bisect_first_bucket'}
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, workspace_id, la_data_client, max_workers=8, timewindow_search='bisect',
+                 batch_cat_heuristic=True, cat_heuristic_batch_size=50, query_cache=None,
+                 entity_batch_size=20):
         self.workspace_id = workspace_id
         self.la_data_client = la_data_client
+        self.max_workers = max_workers
+        self.timewindow_search = timewindow_search
+        self.batch_cat_heuristic = batch_cat_heuristic
+        self.cat_heuristic_batch_size = cat_heuristic_batch_size
+        self.query_cache = query_cache if query_cache is not None else QueryCache.shared()
+        self.entity_batch_size = entity_batch_size
         self.logger = Log()
         self.anomaly = ''
+        self.table_errors = {}
+        self.table_query_counts = {}
+        self._last_error = None
+        self._counts_lock = threading.Lock()
 
     def query_table_list(self):
         """ Get a list of data tables from Log Analytics for the user """
 
         query = AnomalyQueries.get_query('LISTTABLES')
-        return self.query_loganalytics(query)
+        return self.query_loganalytics(query, use_cache=True)
+
+    @Instrumentation.timed()
+    def query_loganalytics(self, query, use_cache=False):
+        """
+        This method will call Log Analytics through LA client
+        use_cache: serve the result from / store it in query_cache, for metadata queries
+        """
+
+        if use_cache:
+            data_frame = self.query_cache.get(self.workspace_id, query)
+            if data_frame is not None:
+                return data_frame
+
+        with Instrumentation.span('AnomalyFinder.query_loganalytics.query'):
+            res = self.la_data_client.query(self.workspace_id, QueryBody(query=query))
+        with Instrumentation.span('AnomalyFinder.query_loganalytics.decode') as span:
+            data_frame = QueryResultDecoder.to_dataframe(res.tables[0])
+            if span.active:
+                span.add_bytes(int(data_frame.memory_usage(index=False).sum()))
+        if use_cache:
+            self.query_cache.put(self.workspace_id, query, data_frame)
+        return data_frame
 
-    def query_loganalytics(self, query):
-        """ This method will call Log Analytics through LA client """
+    def _iter_per_table(self, table_calls, ordered=True):
+        """
+        Run (table, func, args) calls on a bounded thread pool and yield (index, result)
+        as they finish, or in input order when ordered.
+        A failed call yields None and its error is recorded in table_errors under its table.
+        Calls not yet started are cancelled when the generator is closed.
+        """
+
+        table_calls = list(table_calls)
+        if not table_calls:
+            return
+
+        workers = max(1, min(self.max_workers, len(table_calls)))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(func, *args) for _, func, args in table_calls]
+        indexes = {future: i for i, future in enumerate(futures)}
+        try:
+            for future in (futures if ordered else as_completed(futures)):
+                i = indexes[future]
+                try:
+                    result = future.result()
+                except Exception as err: # pylint: disable=broad-except
+                    self.table_errors.setdefault(table_calls[i][0], []).append(str(err))
+                    self._last_error = err
+                    result = None
+                yield i, result
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _reset_errors(self):
+        """ forget the errors and query counts of a previous run """
+
+        self.table_errors = {}
+        self.table_query_counts = {}
+        self._last_error = None
+
+    def _raise_if_all_failed(self, results):
+        """ raise the last query error when every query of a phase failed, nothing was found then """
+
+        if results and self._last_error is not None and all(result is None for result in results):
+            raise self._last_error
+
+    def _report_errors(self):
+        """ print the tables whose queries failed, their errors are kept in table_errors """
+
+        if self.table_errors:
+            print('Queries failed on {0} tables, their anomalies may be missing:'.format(len(self.table_errors)))
+            for tbl, errors in self.table_errors.items():
+                print('  {0}: {1} failed, {2}'.format(tbl, len(errors), errors[-1]))
+
+    def _run_per_table(self, table_calls):
+        """ _iter_per_table, collected into a list in input order """
+
+        results = []
+        for _, result in self._iter_per_table(table_calls, ordered=True):
+            results.append(result)
+        return results
+
+    def _query_table(self, tbl, query, use_cache=False):
+        """ query_loganalytics, counted against the table in table_query_counts """
+
+        with self._counts_lock:
+            self.table_query_counts[tbl] = self.table_query_counts.get(tbl, 0) + 1
+        return self.query_loganalytics(query, use_cache)
+
+    def _query_per_table(self, table_queries, use_cache=False):
+        """ Run (table, query) pairs concurrently, see _run_per_table """
+
+        return self._run_per_table((tbl, self._query_table, (tbl, query, use_cache))
+                                   for tbl, query in table_queries)
+
+    def _single_cat_heuristics(self, table_cols):
+        """ ISCATHEURISTIC for each (table, columns) candidate: one query per column """
+
+        is_cat_heuristic_template = AnomalyQueries.get_template('ISCATHEURISTIC')
+        candidates = [(tbl, col) for tbl, cols in table_cols for col in cols]
+        cat_heuristics = self._query_per_table(
+            (tbl, is_cat_heuristic_template.format(table=tbl, column=col))
+            for tbl, col in candidates)
+
+        return [candidate for candidate, df_is_cat in zip(candidates, cat_heuristics)
+                if df_is_cat is not None and df_is_cat.shape[0] > 0]
+
+    def _batched_cat_heuristics(self, table_cols):
+        """ The ISCATHEURISTIC test for up to cat_heuristic_batch_size columns per query """
+
+        is_cat_heuristic_batch_template = AnomalyQueries.get_template('ISCATHEURISTICBATCH')
+        batches = []
+        for tbl, cols in table_cols:
+            for i in range(0, len(cols), self.cat_heuristic_batch_size):
+                batches.append((tbl, cols[i:i + self.cat_heuristic_batch_size]))
+
+        cat_heuristics = self._query_per_table(
+            (tbl, is_cat_heuristic_batch_template.format(
+                table=tbl,
+                dcounts=', '.join("dc{0} = dcount(['{1}'])".format(i, col) for i, col in enumerate(cols))))
+            for tbl, cols in batches)
+
+        categorical = []
+        for (tbl, cols), df_dcounts in zip(batches, cat_heuristics):
+            if df_dcounts is None or df_dcounts.shape[0] == 0:
+                continue
+            total = df_dcounts.loc[0, 'count_']
+            for i, col in enumerate(cols):
+                dcount = df_dcounts.loc[0, 'dc{0}'.format(i)]
+                if 1 < dcount < 1000 and dcount / total < 1e-2:
+                    categorical.append((tbl, col))
+        return categorical
 
-        res = self.la_data_client.query(self.workspace_id, QueryBody(query=query))
-        json = res.as_dict()
-        cols = json_normalize(json['tables'][0], 'columns')
-        data_frame = json_normalize(json['tables'][0], 'rows')
-        if data_frame.shape[0] != 0:
-            data_frame.columns = cols.name
-        return data_frame
+    @staticmethod
+    def _kql_datetime(value):
+        """
+        render decoded datetimes the way Log Analytics returns them, e.g. 2020-01-01T00:00:00Z
+        or 2020-01-01T00:00:00.1234567Z, fractions without trailing zeros
+        """
+
+        if not isinstance(value, dt.datetime):
+            return value
+        if value.tzinfo is not None:
+            value = value.astimezone(dt.timezone.utc)
+        text = value.strftime('%Y-%m-%dT%H:%M:%S')
+        nanoseconds = value.microsecond * 1000 + getattr(value, 'nanosecond', 0)
+        if nanoseconds:
+            text += '.' + '{0:09d}'.format(nanoseconds).rstrip('0')
+        return text + 'Z'
 
     @staticmethod
-    def construct_related_queries(df_anomalies):
-        """ This method constructs query for user to repo and can be saves for future references """
+    @Instrumentation.timed()
+    def construct_related_queries(df_anomalies, as_list=False):
+        """
+        This method constructs query for user to repo and can be saves for future references
+        as_list: return one query per table instead of one concatenated string
+        """
 
         if df_anomalies.shape[0] == 0:
             return None
 
-        queries = ''
-        for tbl in df_anomalies.Table.unique():
-
-            cur_table_anomalies = df_anomalies.loc[df_anomalies.Table == tbl, :]
+        # the "col == toType(val) or" conditions of all rows at once, joined per table
+        col_types = df_anomalies.colType.astype(str) if 'colType' in df_anomalies.columns else 'string'
+        conditions = (' ' + df_anomalies.colName.astype(str) + ' == to' + col_types + '("'
+                      + df_anomalies.colVal.str.replace('"', '', regex=False) + '") or')
+        table_conditions = conditions.groupby(df_anomalies.Table.values, sort=False).agg(''.join)
+
+        queries = []
+        first_rows = df_anomalies.drop_duplicates('Table')
+        for tbl, q_timestamp, max_timestamp, ent_col, q_entity in zip(
+                first_rows.Table, first_rows.qTimestamp, first_rows.maxTimestamp,
+                first_rows.entCol, first_rows.qEntity):
             query = """{tbl} \
             | where TimeGenerated > datetime({maxTimestamp})-14d and TimeGenerated < datetime({maxTimestamp}) \
             | where {entCol} has "{qEntity}" \
             | where """.format(**{
                 'tbl': tbl,
-                'qTimestamp': cur_table_anomalies.qTimestamp.iloc[0],
-                'maxTimestamp': cur_table_anomalies.maxTimestamp.iloc[0],
-                'entCol': cur_table_anomalies.entCol.iloc[0],
-                'qEntity': cur_table_anomalies.qEntity.iloc[0]
+                'qTimestamp': AnomalyFinder._kql_datetime(q_timestamp),
+                'maxTimestamp': AnomalyFinder._kql_datetime(max_timestamp),
+                'entCol': ent_col,
+                'qEntity': q_entity
             })
 
-            for j, row in cur_table_anomalies.iterrows(): # pylint: disable=unused-variable
-                query += " {col} == to{colType}(\"{colVal}\") or".format(
-                    col=row.colName,
-                    colType=(row.colType) if 'colType' in row.keys() else 'string',
-                    colVal=row.colVal.replace('"', '')
-                )
-
+            query += table_conditions[tbl]
             query = query[:-2] # drop the last or
             query += " | take 1000; " # limit the output size
             query = query.replace("\\", "\\\\")
 
-            queries += query
-        return queries
+            queries.append(query)
+        return queries if as_list else ''.join(queries)
+
+    @staticmethod
+    def _linear_first_bucket(has_hits, start, stop):
+        """ scan the buckets [f, f+1) in [start, stop) one by one, one query per bucket """
+
+        for from_unit in range(start, stop):
+            if has_hits(from_unit, from_unit + 1):
+                return from_unit
+        return None
+
+    @staticmethod
+    def _bisect_first_bucket(has_hits, start, stop):
+        """
+        find the same first bucket as _linear_first_bucket in O(log n) queries,
+        by bisecting on the growing window [start, t)
+        """
+
+        if not has_hits(start, stop):
+            return None
+
+        low, high = start + 1, stop
+        while low < high:
+            mid = (low + high) // 2
+            if has_hits(start, mid):
+                high = mid
+            else:
+                low = mid + 1
+        return low - 1
 
     # pylint: disable=too-many-locals
-    def get_timewindow(self, q_entity, q_timestamp, ent_col, tbl):
-        """ find the relevant time window for analysis """
+    def get_timewindow(self, q_entity, q_timestamp, ent_col, tbl, search=None):
+        """
+        find the relevant time window for analysis
+        search is 'linear' (bucket by bucket) or 'bisect', defaults to self.timewindow_search
+        """
+
+        search = search or self.timewindow_search
+        if search not in self.TIMEWINDOW_SEARCHES:
+            raise InputError('search')
+        find_first_bucket = getattr(self, self.TIMEWINDOW_SEARCHES[search])
 
-        win_start = 0
         min_timestamp = None
         delta = None
         max_timestamp = None
         long_min_timestamp = None
-        time_window_query_template = AnomalyQueries.get_query('TIMEWINDOWQUERY')
+        time_window_query_template = AnomalyQueries.get_template('TIMEWINDOWQUERY')
 
-        for from_hour in range(-30, 0, 1):
-            kql_time_range_d = time_window_query_template.format(
+        def has_hits(from_unit, to_unit, unit):
+            kql_time_range = time_window_query_template.format(
                 table=tbl,
                 qDate=q_timestamp,
                 entColumn=ent_col,
                 qEntity=q_entity,
-                f=from_hour,
-                t=from_hour+1,
-                delta='d')
+                f=from_unit,
+                t=to_unit,
+                delta=unit)
+            return self._query_table(tbl, kql_time_range).shape[0] > 0
 
-            df_time_range = self.query_loganalytics(kql_time_range_d)
-
-            if df_time_range.shape[0] > 0:
-                win_start = from_hour
-                break
+        win_start = find_first_bucket(lambda f, t: has_hits(f, t, 'd'), -30, 0)
+        if win_start is None:
+            win_start = 0
 
         dt_q_timestamp = pd.to_datetime(q_timestamp)
         ind2now = dt.datetime.utcnow() - dt_q_timestamp
@@ -152,22 +408,9 @@ class AnomalyFinder():
             min_timestamp = max_timestamp + dt.timedelta(days=max([-6, win_start]))
 
         elif win_start < 0: # switch to hours
-            win_start_hour = -5
-            for from_hour in range(-3*24, -5, 1):
-                kql_time_range_h = time_window_query_template.format(
-                    table=tbl,
-                    qDate=q_timestamp,
-                    entColumn=ent_col,
-                    qEntity=q_entity,
-                    f=from_hour,
-                    t=from_hour+1,
-                    delta='h')
-
-                df_time_range = self.query_loganalytics(kql_time_range_h)
-
-                if df_time_range.shape[0] > 0:
-                    win_start_hour = from_hour
-                    break
+            win_start_hour = find_first_bucket(lambda f, t: has_hits(f, t, 'h'), -3*24, -5)
+            if win_start_hour is None:
+                win_start_hour = -5
             if win_start_hour < -5:
                 if ind2now > dt.timedelta(hours=1):
                     delta = '1h'
@@ -180,75 +423,127 @@ class AnomalyFinder():
 
         return min_timestamp, delta, max_timestamp, long_min_timestamp
 
-    # pylint: disable=too-many-locals
-    def run(self, q_timestamp, q_entity, tables):
-        """ Main function for Anomaly Lookup """
-
-        progress_bar = AnomalyLookupViewHelper.define_int_progress_bar()
-        display(progress_bar)  # pylint: disable=undefined-variable
-
-        # list tables if not given
-        if not tables:
-            kql_list_tables = AnomalyQueries.get_query('LISTTABLES')
-            tables = self.query_loganalytics(kql_list_tables)
-            tables = tables.SentinelTableName.tolist()
+    @Instrumentation.timed()
+    def _find_entity_tables(self, q_timestamp, q_entity, tables):
+        """
+        find the column in which the query entity appears in each table
+        - assumption that it appears in just one columns
+        """
 
-        progress_bar.value += 1
-
-        # find the column in which the query entity appears in each table
-        # - assumption that it appears in just one columns
         tables2search = []
-        is_entity_in_table_template = AnomalyQueries.get_query('ISENTITYINTABLE')
+        is_entity_in_table_template = AnomalyQueries.get_template('ISENTITYINTABLE')
+        entity_probes = self._query_per_table(
+            (tbl, is_entity_in_table_template.format(table=tbl, qDate=q_timestamp, qEntity=q_entity))
+            for tbl in tables)
+        self._raise_if_all_failed(entity_probes)
 
+        for tbl, ent_in_table in zip(tables, entity_probes):
+            if ent_in_table is not None and ent_in_table.shape[0] > 0:
+                tables2search.append({'table': tbl, 'entCol': AnomalyFinder._entity_column(ent_in_table, q_entity)})
+        return tables2search
+
+    @staticmethod
+    def _entity_column(ent_in_table, q_entity):
+        """ the first column of an ISENTITYINTABLE result containing the entity """
+
+        # dynamic columns are decoded to dicts and lists, str.contains gives NaN for them
+        ent_col = [col for col in ent_in_table.select_dtypes('object').columns[1:] if
+                   ent_in_table.loc[:, col].map(lambda value: isinstance(value, str)).all()
+                   and ent_in_table.loc[:, col].str.contains(q_entity, case=False).all()]
+        if ent_col:
+            ent_col = ent_col[0]
+        return ent_col
+
+    @Instrumentation.timed()
+    def _find_entity_tables_batch(self, entity_timestamps, tables):
+        """
+        _find_entity_tables for many (entity, timestamp) pairs: the probes of up to
+        entity_batch_size pairs are sent as one union query per table
+        """
+
+        tables2search = [[] for _ in entity_timestamps]
+        is_entity_in_table_batch_template = AnomalyQueries.get_template('ISENTITYINTABLEBATCH')
+        probes = []
         for tbl in tables:
-            kql_entity_in_table = is_entity_in_table_template.format(
-                table=tbl,
-                qDate=q_timestamp,
-                qEntity=q_entity)
-            ent_in_table = self.query_loganalytics(kql_entity_in_table)
+            for start in range(0, len(entity_timestamps), self.entity_batch_size):
+                indexes = range(start, min(start + self.entity_batch_size, len(entity_timestamps)))
+                sub_queries = [is_entity_in_table_batch_template.format(
+                    table=tbl,
+                    qDate=entity_timestamps[i][1],
+                    qEntity=entity_timestamps[i][0],
+                    index=i) for i in indexes]
+                probes.append((tbl, indexes, 'union ' + ', '.join(sub_queries)))
+
+        entity_probes = self._query_per_table((tbl, query) for tbl, _, query in probes)
+        self._raise_if_all_failed(entity_probes)
+
+        for (tbl, indexes, _), ent_in_tables in zip(probes, entity_probes):
+            if ent_in_tables is None or ent_in_tables.shape[0] == 0:
+                continue
+            for i in indexes:
+                ent_in_table = ent_in_tables.loc[ent_in_tables.SentinelBatchIndex == i, :] \
+                    .drop(columns='SentinelBatchIndex').reset_index(drop=True)
+                if ent_in_table.shape[0] > 0:
+                    q_entity = entity_timestamps[i][0]
+                    tables2search[i].append({'table': tbl, 'entCol': AnomalyFinder._entity_column(ent_in_table, q_entity)})
+
+        # keep the table order of the tables list for every entity
+        table_order = {tbl: i for i, tbl in enumerate(tables)}
+        for entity_tables in tables2search:
+            entity_tables.sort(key=lambda tbl: table_order[tbl['table']])
+        return tables2search
+
+    @Instrumentation.timed()
+    def _attach_time_windows(self, q_timestamp, q_entity, tables2search):
+        """ for each table, find the time window to query on """
+
+        time_windows = self._run_per_table(
+            (tbl['table'], self.get_timewindow, (q_entity, q_timestamp, tbl['entCol'], tbl['table']))
+            for tbl in tables2search)
+        for tbl, time_window in zip(tables2search, time_windows):
+            tbl['minTimestamp'], tbl['delta'], tbl['maxTimestamp'], tbl['longMinTimestamp'] = \
+            time_window if time_window is not None else (None, None, None, None)
 
-            if ent_in_table.shape[0] > 0:
-                ent_col = [col for col in ent_in_table.select_dtypes('object').columns[1:] if
-                           ent_in_table.loc[0, col] is not None
-                           and ent_in_table.loc[:, col].str.contains(q_entity, case=False).all()]
-                if ent_col:
-                    ent_col = ent_col[0]
-                tables2search.append({'table': tbl, 'entCol': ent_col})
+    @Instrumentation.timed()
+    def _find_categorical_columns(self, tables):
+        """ identify all the categorical columns per table, as (table, column) pairs """
 
-        progress_bar.value += 2
+        is_cat_column_template = AnomalyQueries.get_template('ISCATCOLUMN')
+        table_columns = self._query_per_table(
+            ((tbl, is_cat_column_template.format(table=tbl)) for tbl in tables),
+            use_cache=True)
 
-        # for each table, find the time window to query on
-        for tbl in tables2search:
-            tbl['minTimestamp'], tbl['delta'], tbl['maxTimestamp'], tbl['longMinTimestamp'] = \
-            self.get_timewindow(q_entity, q_timestamp, tbl['entCol'], tbl['table'])
+        table_cols = [(tbl, df_cols.ColumnName.tolist())
+                      for tbl, df_cols in zip(tables, table_columns)
+                      if df_cols is not None and df_cols.shape[0] > 0]
+        if self.batch_cat_heuristic:
+            return self._batched_cat_heuristics(table_cols)
+        return self._single_cat_heuristics(table_cols)
 
-        progress_bar.value += 1
+    @staticmethod
+    def _categorical_col_infos(tables2search, cat_candidates):
+        """ one table info per categorical column, on which we will find anomalies """
 
-        # identify all the categorical columns per table on which we will find anomalies
         categorical_cols = []
-        is_cat_column_template = AnomalyQueries.get_query('ISCATCOLUMN')
-        is_cat_heuristic_template = AnomalyQueries.get_query('ISCATHEURISTIC')
-        for tbl in tables2search:
-            kql_is_cat_column = is_cat_column_template.format(table=tbl['table'])
-            df_cols = self.query_loganalytics(kql_is_cat_column)
-
-            for col in df_cols.ColumnName:
-                kql_is_cat_heuristic = is_cat_heuristic_template.format(
-                    table=tbl['table'],
-                    column=col)
-                df_is_cat = self.query_loganalytics(kql_is_cat_heuristic)
-
-                if df_is_cat.shape[0] > 0:
-                    cat_col_info = copy.deepcopy(tbl)
-                    cat_col_info['col'] = col
-                    categorical_cols.append(cat_col_info)
+        tables_by_name = {tbl['table']: tbl for tbl in tables2search}
+        for tbl, col in cat_candidates:
+            if tbl in tables_by_name:
+                cat_col_info = copy.deepcopy(tables_by_name[tbl])
+                cat_col_info['col'] = col
+                categorical_cols.append(cat_col_info)
+        return categorical_cols
 
-        progress_bar.value += 2
+    @staticmethod
+    def _anomaly_queries(q_timestamp, q_entity, categorical_cols):
+        """ (table, query) of the time series anomaly detection for each categorical column """
 
-        anomalies_list = []
+        anomaly_queries = []
         time_series_anomaly_detection_template = \
-            AnomalyQueries.get_query('TIMESERIESANOMALYDETECTION')
+            AnomalyQueries.get_template('TIMESERIESANOMALYDETECTION')
         for col_info in categorical_cols:
+            if col_info['maxTimestamp'] is None:
+                # no time window found for the entity in this table
+                continue
             max_timestamp = col_info['maxTimestamp'].strftime('%Y-%m-%dT%H:%M:%S.%f')
             long_min_timestamp = col_info['longMinTimestamp'].strftime('%Y-%m-%dT%H:%M:%S.%f')
 
@@ -262,9 +557,130 @@ class AnomalyFinder():
                 qTimestamp=q_timestamp,
                 delta=col_info['delta'])
 
-            cur_anomalies = self.query_loganalytics(kql_time_series_anomaly_detection)
+            anomaly_queries.append((col_info['table'], kql_time_series_anomaly_detection))
+        return anomaly_queries
+
+    def _iter_anomalies(self, q_timestamp, q_entity, tables, ordered, progress):
+        """ iter_anomalies, reporting phase progress through progress(step) """
+
+        # list tables if not given
+        if not tables:
+            tables = self.query_table_list()
+            tables = tables.SentinelTableName.tolist()
+
+        progress(1)
+
+        self._reset_errors()
+        tables2search = self._find_entity_tables(q_timestamp, q_entity, tables)
+
+        progress(2)
+
+        self._attach_time_windows(q_timestamp, q_entity, tables2search)
+
+        progress(1)
+
+        cat_candidates = self._find_categorical_columns([tbl['table'] for tbl in tables2search])
+        categorical_cols = AnomalyFinder._categorical_col_infos(tables2search, cat_candidates)
+
+        progress(2)
+
+        anomaly_queries = AnomalyFinder._anomaly_queries(q_timestamp, q_entity, categorical_cols)
+        for _, cur_anomalies in self._iter_per_table(
+                ((tbl, self._query_table, (tbl, query)) for tbl, query in anomaly_queries),
+                ordered=ordered):
+            if cur_anomalies is not None:
+                yield cur_anomalies
+        self._report_errors()
+
+    def iter_anomalies(self, q_timestamp, q_entity, tables, ordered=False):
+        """
+        Generator flavour of run: yields the anomalies DataFrame of each categorical column
+        as soon as its query finishes (in column order when ordered).
+        Closing the generator early cancels the queries not yet started.
+        """
+
+        return self._iter_anomalies(q_timestamp, q_entity, tables, ordered, lambda step: None)
+
+    # pylint: disable=too-many-locals
+    @Instrumentation.timed()
+    def run_batch(self, entity_timestamps, tables=None):
+        """
+        Anomaly Lookup for a list of (entity, timestamp) pairs.
+        Returns a dict keyed by (entity, timestamp) holding the (anomalies, queries) of run.
+        """
+
+        entity_timestamps = list(dict.fromkeys((q_entity, q_timestamp) for q_entity, q_timestamp in entity_timestamps))
+
+        progress_bar = AnomalyLookupViewHelper.define_int_progress_bar()
+        display(progress_bar)  # pylint: disable=undefined-variable
+
+        # list tables if not given
+        if not tables:
+            tables = self.query_table_list()
+            tables = tables.SentinelTableName.tolist()
+
+        progress_bar.value += 1
+
+        self._reset_errors()
+        tables2search = self._find_entity_tables_batch(entity_timestamps, tables)
+
+        progress_bar.value += 2
+
+        # time windows depend on the entity, they are searched for all pairs at once
+        window_tables = [((q_entity, q_timestamp), tbl)
+                         for (q_entity, q_timestamp), entity_tables in zip(entity_timestamps, tables2search)
+                         for tbl in entity_tables]
+        time_windows = self._run_per_table(
+            (tbl['table'], self.get_timewindow, (q_entity, q_timestamp, tbl['entCol'], tbl['table']))
+            for (q_entity, q_timestamp), tbl in window_tables)
+        for (_, tbl), time_window in zip(window_tables, time_windows):
+            tbl['minTimestamp'], tbl['delta'], tbl['maxTimestamp'], tbl['longMinTimestamp'] = \
+            time_window if time_window is not None else (None, None, None, None)
+
+        progress_bar.value += 1
+
+        # categorical columns only depend on the table, they are shared by all pairs
+        searched_tables = list(dict.fromkeys(tbl['table'] for entity_tables in tables2search for tbl in entity_tables))
+        cat_candidates = self._find_categorical_columns(searched_tables)
+
+        progress_bar.value += 2
+
+        pair_queries = []
+        for (q_entity, q_timestamp), entity_tables in zip(entity_timestamps, tables2search):
+            categorical_cols = AnomalyFinder._categorical_col_infos(entity_tables, cat_candidates)
+            pair_queries.extend(((q_entity, q_timestamp), tbl, query) for tbl, query in
+                                AnomalyFinder._anomaly_queries(q_timestamp, q_entity, categorical_cols))
+        pair_anomalies = self._query_per_table((tbl, query) for _, tbl, query in pair_queries)
+
+        progress_bar.value += 2
+
+        anomalies_lists = {pair: [] for pair in entity_timestamps}
+        for (pair, _, _), cur_anomalies in zip(pair_queries, pair_anomalies):
+            if cur_anomalies is not None:
+                anomalies_lists[pair].append(cur_anomalies)
+
+        results = {}
+        for pair, anomalies_list in anomalies_lists.items():
+            anomalies = pd.concat(anomalies_list, axis=0) if anomalies_list else pd.DataFrame()
+            results[pair] = (anomalies, AnomalyFinder.construct_related_queries(anomalies))
+
+        progress_bar.value += 2
+        progress_bar.close()
+        self._report_errors()
+
+        return results
+
+    @Instrumentation.timed()
+    def run(self, q_timestamp, q_entity, tables):
+        """ Main function for Anomaly Lookup """
+
+        progress_bar = AnomalyLookupViewHelper.define_int_progress_bar()
+        display(progress_bar)  # pylint: disable=undefined-variable
+
+        def progress(step):
+            progress_bar.value += step
 
-            anomalies_list.append(cur_anomalies)
+        anomalies_list = list(self._iter_anomalies(q_timestamp, q_entity, tables, True, progress))
 
         progress_bar.value += 2
 
@@ -276,7 +692,7 @@ class AnomalyFinder():
         progress_bar.value += 2
         queries = AnomalyFinder.construct_related_queries(anomalies)
         progress_bar.close()
-        self.anomaly = str(anomalies.to_json(orient='records'))
+        self.anomaly = str(anomalies.to_json(orient='records', date_format='iso'))
 
         return anomalies, queries
 # End of the Module #
@@ -0,0 +1,171 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Query Cache:
+This module provides a cache for Log Analytics query results,
+used for metadata queries (table lists, schemas) which barely change.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+
+class QueryCache():
+    """
+    In-memory LRU cache of query result DataFrames with a time to live.
+    Entries are keyed by workspace id plus a hash of the query text.
+    When cache_dir is given, entries are also written to disk so they survive kernel restarts,
+    as pandas table schema JSON: reading a cache file never runs code, unlike a pickle would.
+    Datetimes are stored to the microsecond.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, ttl=3600, max_entries=256, cache_dir=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """ process wide in-memory cache, used by AnomalyFinder by default """
+
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @staticmethod
+    def make_key(workspace_id, query):
+        """ cache key of a query against a workspace """
+
+        return str(workspace_id), hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        workspace_id, query_hash = key
+        return os.path.join(self.cache_dir, workspace_id, query_hash + '.json')
+
+    def _is_fresh(self, stored_at):
+        return time.time() - stored_at < self.ttl
+
+    def _read_disk(self, key):
+        """ load an entry from the disk store, None if missing or expired """
+
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if not self._is_fresh(stored_at):
+                return None
+            return stored_at, pd.read_json(path, orient='table')
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_disk(self, key, data_frame):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        # written aside and renamed, so a reader never sees half a file
+        temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data_frame.to_json(temp_path, orient='table', date_unit='ns')
+            os.replace(temp_path, path)
+        except (OSError, ValueError, NotImplementedError):
+            # the in-memory entry is still there, the result just won't outlive the kernel
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def get(self, workspace_id, query):
+        """ cached result of the query, None on a miss """
+
+        key = QueryCache.make_key(workspace_id, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry[0]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].copy()
+            self._entries.pop(key, None)
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, entry)
+        return entry[1].copy()
+
+    def put(self, workspace_id, query, data_frame):
+        """ cache the result of the query """
+
+        key = QueryCache.make_key(workspace_id, query)
+        with self._lock:
+            self._store(key, (time.time(), data_frame.copy()))
+        self._write_disk(key, data_frame)
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, workspace_id=None, query=None):
+        """
+        Drop cached entries: one query of a workspace, a whole workspace,
+        or everything when no workspace is given
+        """
+
+        with self._lock:
+            if workspace_id is None:
+                keys = list(self._entries)
+            elif query is not None:
+                keys = [QueryCache.make_key(workspace_id, query)]
+            else:
+                keys = [key for key in self._entries if key[0] == str(workspace_id)]
+            for key in keys:
+                self._entries.pop(key, None)
+
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return
+        if workspace_id is None:
+            workspace_dirs = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+        else:
+            workspace_dirs = [os.path.join(self.cache_dir, str(workspace_id))]
+        for workspace_dir in workspace_dirs:
+            if not os.path.isdir(workspace_dir):
+                continue
+            if query is not None:
+                file_names = [QueryCache.make_key(workspace_id, query)[1] + '.json']
+            else:
+                file_names = os.listdir(workspace_dir)
+            for file_name in file_names:
+                try:
+                    os.remove(os.path.join(workspace_dir, file_name))
+                except OSError:
+                    pass
+
+    def stats(self):
+        """ hit/miss counters and number of in-memory entries """
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+# End of the Module #
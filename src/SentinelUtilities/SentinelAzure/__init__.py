@@ -2,7 +2,17 @@
 # pylint: disable=line-too-long
 """
 SentinelAzure: This package is developed for initializing and manipulating Python client objects of Azure Resource Management
+Members are imported on first access.
 """
 
 # __init__.py
-from .azure_loganalytics_helper import *
+from SentinelUtils.lazy_import import lazy_exports
+
+_EXPORTS = {
+    'WorkspaceInfo': '.azure_loganalytics_helper',
+    'LogAnalyticsHelper': '.azure_loganalytics_helper',
+    'LogAnalyticsFanout': '.loganalytics_fanout'
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -5,24 +5,135 @@
 # --------------------------------------------------------------------------
 """
 Azure LogAnalytics Helper:
-This module provides helper methods to initialize and 
+This module provides helper methods to initialize and
 manipulate LogAnalyticsManagementClient object.
 Workspace is the focal point.
 """
 
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+from SentinelExceptions import InputError
+
+WorkspaceInfo = namedtuple('WorkspaceInfo', ['name', 'customer_id', 'resource_id', 'resource_group', 'location'])
+WorkspaceInfo.__doc__ = """ Indexed fields of a Log Analytics workspace """
+
 
 class LogAnalyticsHelper():
-    """ Helper class for Log Analytics """
+    """
+    Helper class for Log Analytics.
+    Workspaces are listed once and indexed by name, customer id and resource id,
+    the index is rebuilt after ttl seconds.
+    Workspace names are only unique within a resource group: a duplicated name resolves
+    to the first workspace listed, as before, use the customer id or resource id for the others.
+    When snapshot_path is given, the index is also saved there as JSON
+    and reused by the next helper while it is fresh.
+    """
 
-    def __init__(self, la_client):
+    def __init__(self, la_client, ttl=3600, snapshot_path=None):
         self.la_client = la_client
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self._workspaces = None
+        self._by_name = {}
+        self._by_customer_id = {}
+        self._by_resource_id = {}
+        self._built_at = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _to_info(ws):
+        resource_id = ws.id or ''
+        parts = resource_id.split('/')
+        lowered = [part.lower() for part in parts]
+        resource_group = parts[lowered.index('resourcegroups') + 1] if 'resourcegroups' in lowered[:-1] else None
+        return WorkspaceInfo(ws.name, str(ws.customer_id), resource_id, resource_group, getattr(ws, 'location', None))
+
+    def _set_index(self, workspaces, built_at):
+        self._workspaces = workspaces
+        self._by_name = {}
+        self._by_customer_id = {}
+        self._by_resource_id = {}
+        # the first listed workspace wins, as the linear search did
+        for ws in workspaces:
+            self._by_name.setdefault(ws.name, ws)
+            self._by_customer_id.setdefault(ws.customer_id.lower(), ws)
+            self._by_resource_id.setdefault(ws.resource_id.lower(), ws)
+        self._built_at = built_at
+
+    def _load_snapshot(self):
+        """ index from the snapshot file, False if it is missing or stale """
+        if not self.snapshot_path:
+            return False
+        try:
+            with open(self.snapshot_path, 'r') as snapshot:
+                data = json.load(snapshot)
+            if time.time() - data['built_at'] >= self.ttl:
+                return False
+            self._set_index([WorkspaceInfo(*ws) for ws in data['workspaces']], data['built_at'])
+            return True
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'w') as snapshot:
+            json.dump({'built_at': self._built_at, 'workspaces': [list(ws) for ws in self._workspaces]}, snapshot)
+        os.replace(temp_path, self.snapshot_path)
+
+    def refresh(self):
+        """ list the workspaces again and rebuild the index """
+        workspaces = [LogAnalyticsHelper._to_info(ws) for ws in self.la_client.workspaces.list()]
+        with self._lock:
+            self._set_index(workspaces, time.time())
+            self._save_snapshot()
+
+    def _ensure_index(self):
+        if self._workspaces is not None and time.time() - self._built_at < self.ttl:
+            return
+        with self._lock:
+            if self._workspaces is None and self._load_snapshot():
+                return
+        self.refresh()
+
+    def _lookup(self, key):
+        return (self._by_name.get(key)
+                or self._by_customer_id.get(str(key).lower())
+                or self._by_resource_id.get(str(key).lower()))
+
+    def get_workspace(self, key):
+        """
+        retrieve the WorkspaceInfo of a workspace by name, customer id or resource id,
+        the index is refreshed once before an unknown workspace is reported
+        """
+        self._ensure_index()
+        workspace = self._lookup(key)
+        if workspace is None:
+            self.refresh()
+            workspace = self._lookup(key)
+        if workspace is None:
+            raise InputError(key)
+        return workspace
+
+    def get_workspaces(self):
+        """ retrieve all workspaces as WorkspaceInfo """
+        self._ensure_index()
+        return list(self._workspaces)
 
     def get_workspace_name_list(self):
         """ retrieve L.A. workspace names as a list """
-        return sorted([ws.name for ws in self.la_client.workspaces.list()])
+        self._ensure_index()
+        return sorted(ws.name for ws in self._workspaces)
 
     def get_workspace_id(self, workspace_name):
         """ retrieve L.A. workspace id based on workspace name """
-        workspace = next(ws for ws in self.la_client.workspaces.list() if ws.name == workspace_name)
-        return workspace.customer_id
+        return self.get_workspace(workspace_name).customer_id
 # end of the class
@@ -0,0 +1,165 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Log Analytics Fan-out:
+This module runs one KQL query against many Log Analytics workspaces concurrently,
+tags the rows with their source workspace and keeps per-workspace statistics.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+from azure.loganalytics.models import QueryBody
+from SentinelExceptions import InputError
+from SentinelUtils.query_result_decoder import QueryResultDecoder
+
+
+class _WorkspaceLimiter():
+    """ At most max_concurrent queries in flight and min_interval seconds between query starts """
+
+    def __init__(self, max_concurrent, min_interval):
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._min_interval = min_interval
+        self._next_start = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        if self._min_interval:
+            with self._lock:
+                start = max(time.monotonic(), self._next_start)
+                self._next_start = start + self._min_interval
+            delay = start - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return self
+
+    def __exit__(self, *args):
+        self._semaphore.release()
+
+
+class LogAnalyticsFanout():
+    """
+    Runs a query against a set of workspaces on a bounded thread pool.
+    Workspaces are customer ids, or names / resource ids when a LogAnalyticsHelper is given.
+    Each workspace gets at most max_concurrent_per_workspace queries in flight,
+    started at least min_interval seconds apart.
+    Rows are tagged with the workspace in workspace_column.
+    """
+
+    def __init__(self,
+                 la_data_client,
+                 la_helper=None,
+                 max_workers=16,
+                 max_concurrent_per_workspace=1,
+                 min_interval=0.0,
+                 workspace_column='SourceWorkspace'):
+        self.la_data_client = la_data_client
+        self.la_helper = la_helper
+        self.max_workers = max_workers
+        self.max_concurrent_per_workspace = max_concurrent_per_workspace
+        self.min_interval = min_interval
+        self.workspace_column = workspace_column
+        self._limiters = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, workspace):
+        """ (label, customer id) of a workspace, None for a workspace the helper does not know """
+        if self.la_helper is None:
+            return str(workspace), str(workspace)
+        try:
+            info = self.la_helper.get_workspace(workspace)
+        except InputError:
+            self._limiter(str(workspace))
+            self._record(str(workspace), 0.0, error='unknown workspace')
+            return None
+        return info.name, info.customer_id
+
+    def _limiter(self, workspace_id):
+        with self._lock:
+            if workspace_id not in self._limiters:
+                self._limiters[workspace_id] = _WorkspaceLimiter(self.max_concurrent_per_workspace, self.min_interval)
+                self._stats[workspace_id] = {'queries': 0, 'errors': 0, 'rows': 0,
+                                             'total_seconds': 0.0, 'max_seconds': 0.0, 'last_error': None}
+            return self._limiters[workspace_id]
+
+    def _record(self, workspace_id, seconds, rows=0, error=None):
+        with self._lock:
+            stats = self._stats[workspace_id]
+            stats['queries'] += 1
+            stats['rows'] += rows
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if error is not None:
+                stats['errors'] += 1
+                stats['last_error'] = error
+
+    def _query_workspace(self, label, workspace_id, query, timespan):
+        with self._limiter(workspace_id):
+            start = time.perf_counter()
+            try:
+                res = self.la_data_client.query(workspace_id, QueryBody(query=query, timespan=timespan))
+                data_frame = QueryResultDecoder.to_dataframe(res.tables[0])
+            except Exception as err: # pylint: disable=broad-except
+                self._record(workspace_id, time.perf_counter() - start, error=str(err))
+                return None
+            self._record(workspace_id, time.perf_counter() - start, len(data_frame))
+
+        data_frame[self.workspace_column] = label
+        return data_frame
+
+    def iter_query(self, query, workspaces, timespan=None):
+        """
+        Generator of (workspace, DataFrame) as the workspaces answer.
+        Failed and unknown workspaces are skipped and reported by stats().
+        Queries not yet started are cancelled when the generator is closed.
+        """
+        targets = [target for target in (self._resolve(workspace) for workspace in workspaces) if target is not None]
+        if not targets:
+            return
+        for _, workspace_id in targets:
+            self._limiter(workspace_id)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(targets))))
+        futures = {executor.submit(self._query_workspace, label, workspace_id, query, timespan): label
+                   for label, workspace_id in targets}
+        try:
+            for future in as_completed(futures):
+                data_frame = future.result()
+                if data_frame is not None:
+                    yield futures[future], data_frame
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def query(self, query, workspaces, timespan=None):
+        """ Run the query against every workspace and merge the tagged results into one DataFrame """
+        frames = [data_frame for _, data_frame in self.iter_query(query, workspaces, timespan)]
+        if not frames:
+            return pd.DataFrame(columns=[self.workspace_column])
+        return pd.concat(frames, ignore_index=True, sort=False)
+
+    def stats(self):
+        """ per-workspace query count, errors, rows and latency as a DataFrame indexed by workspace id, or by name for unknown workspaces """
+        with self._lock:
+            rows = {workspace_id: dict(stats) for workspace_id, stats in self._stats.items()}
+        stats_frame = pd.DataFrame.from_dict(rows, orient='index',
+                                             columns=['queries', 'errors', 'rows', 'total_seconds', 'max_seconds', 'last_error'])
+        stats_frame['mean_seconds'] = stats_frame['total_seconds'] / stats_frame['queries'].where(stats_frame['queries'] > 0)
+        return stats_frame
+
+    def reset_stats(self):
+        """ clear the per-workspace statistics """
+        with self._lock:
+            for workspace_id in self._stats:
+                self._stats[workspace_id] = {'queries': 0, 'errors': 0, 'rows': 0,
+                                             'total_seconds': 0.0, 'max_seconds': 0.0, 'last_error': None}
+
+# end of the class
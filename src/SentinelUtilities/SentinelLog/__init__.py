@@ -1,7 +1,17 @@
 # pylint: disable-msg=C0103
 """
 SentinelLog: This package provides log functionalities.
+Members are imported on first access.
 """
 
 # __init__.py
-from .log import Log
+from SentinelUtils.lazy_import import lazy_exports
+
+_EXPORTS = {
+    'Log': '.log',
+    'NullSink': '.log',
+    'LocalFileSink': '.log'
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
@@ -8,31 +8,130 @@ log module:
 This module provides log functionalities through Azure Application Insights
 """
 
+import atexit
+import datetime as dt
+import json
+import threading
 
 from applicationinsights import TelemetryClient
+from applicationinsights.channel import AsynchronousQueue, AsynchronousSender, TelemetryChannel
 from SentinelUtils.obfuscation_utility import ObfuscationUtility
 
 
+class NullSink:
+    """ Telemetry sink dropping everything, for offline runs and benchmarks """
+
+    def track_trace(self, name, *args, **kwargs):
+        """ drop a trace """
+
+    def track_event(self, name, *args, **kwargs):
+        """ drop an event """
+
+    def flush(self):
+        """ nothing to flush """
+
+
+class LocalFileSink:
+    """ Telemetry sink appending JSON lines to a local file, written in batches of batch_size """
+
+    def __init__(self, path, batch_size=50):
+        self.path = path
+        self.batch_size = batch_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def _track(self, kind, name):
+        with self._lock:
+            self._buffer.append({'time': dt.datetime.utcnow().isoformat() + 'Z', 'type': kind, 'name': name})
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def track_trace(self, name, *args, **kwargs):
+        """ record a trace """
+        self._track('trace', name)
+
+    def track_event(self, name, *args, **kwargs):
+        """ record an event """
+        self._track('event', name)
+
+    def flush(self):
+        """ write the buffered records """
+        with self._lock:
+            records, self._buffer = self._buffer, []
+            if records:
+                with open(self.path, 'a') as log_file:
+                    log_file.writelines(json.dumps(record) + '\n' for record in records)
+
+
 class Log:
-    """ The class performs log action """
+    """
+    The class performs log action.
+    Telemetry goes through one Application Insights client per process, created on first use.
+    Its channel batches items in the background: a batch is sent when MAX_BATCH_SIZE items are queued
+    or SEND_INTERVAL seconds have passed, and whatever is left is sent when the interpreter exits.
+    Pass client=NullSink() or LocalFileSink(path) to keep telemetry off the network.
+    """
+
+    MAX_BATCH_SIZE = 50
+    SEND_INTERVAL = 5.0
 
-    def __init__(self):
+    _shared_client = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, client=None):
         self.seed = b'IVnGT69i43R1i6qokpVxIx_tE2MyBlMebu4yJfJh1Ow='
         # pylint: disable=line-too-long
         self.ai_code = b'gAAAAABdN3UmwZJHHxTybj0KRbKNehSo55DZ5Bi2QtohQsrEgy-WZNWDQAETVnaeJbQ4S0ltZLkebi_hhueaxl_uxYE5HheuB0ZFobq1IzgE163jUsjSLqilcqzy_uLKkSTYHAxYNLxL'
+        self._client = client
+
+    @property
+    def client(self):
+        """ the sink telemetry is sent to, the shared Application Insights client by default """
+        if self._client is None:
+            self._client = self._get_shared_client()
+        return self._client
+
+    def _get_shared_client(self):
+        with Log._shared_lock:
+            if Log._shared_client is None:
+                sender = AsynchronousSender()
+                sender.send_interval = Log.SEND_INTERVAL
+                sender.send_buffer_size = Log.MAX_BATCH_SIZE
+                queue = AsynchronousQueue(sender)
+                queue.max_queue_length = Log.MAX_BATCH_SIZE
+                obfuscate = ObfuscationUtility(self.seed)
+                client = TelemetryClient(obfuscate.deobfuscate_text(self.ai_code), TelemetryChannel(None, queue))
+                atexit.register(Log._drain, queue)
+                Log._shared_client = client
+            return Log._shared_client
+
+    @staticmethod
+    def _drain(queue):
+        """ send the queued items synchronously, the background sender thread dies with the interpreter """
+        batch = []
+        item = queue.get()
+        while item:
+            batch.append(item)
+            if len(batch) >= Log.MAX_BATCH_SIZE:
+                queue.sender.send(batch)
+                batch = []
+            item = queue.get()
+        if batch:
+            queue.sender.send(batch)
 
     def log(self, telemetry_instance):
         """ Log Telemetry instance """
 
-        obfuscate = ObfuscationUtility(self.seed)
-        client = TelemetryClient(obfuscate.deobfuscate_text(self.ai_code))
-        client.track_trace(str(telemetry_instance))
-        client.flush()
+        self.client.track_trace(str(telemetry_instance))
 
     def log_event(self, message):
         """ Log simple message in strinbg """
 
-        obfuscate = ObfuscationUtility(self.seed)
-        client = TelemetryClient(obfuscate.deobfuscate_text(self.ai_code))
-        client.track_event(message)
-        client.flush()
+        self.client.track_event(message)
+
+    def flush(self):
+        """ Send the queued telemetry now instead of waiting for the next batch """
+
+        self.client.flush()
@@ -2,7 +2,20 @@
 # pylint: disable=line-too-long
 """
 SentinelPortal: This package is developed for Sentinel notebooks integrating with Sentinel portal
+Members are imported on first access.
 """
 
 # __init__.py
-from .bookmark_helper import Constants, BookmarkProperties, BookmarkModel, BookmarkHelper
+from SentinelUtils.lazy_import import lazy_exports
+
+_EXPORTS = {
+    'Constants': '.bookmark_helper',
+    'BookmarkProperties': '.bookmark_helper',
+    'BookmarkModel': '.bookmark_helper',
+    'BookmarkResult': '.bookmark_helper',
+    'BookmarkRecord': '.bookmark_helper',
+    'BookmarkHelper': '.bookmark_helper'
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
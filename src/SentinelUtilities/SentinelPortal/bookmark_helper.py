@@ -17,10 +17,21 @@ manipulate Hunting Bookmark (create, read, and delete).
 # pylint: disable-msg=W0201
 # pylint: disable=line-too-long
 
+import email.utils
+import json
+import math
+import sys
+import threading
+import time
 import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
 import requests
-import jsons
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from SentinelUtils import InputValidation
+from SentinelUtils.instrumentation import Instrumentation
 
 
 class Constants():
@@ -48,12 +59,55 @@ class Constants():
                    'Url']
 
 
+def _payload_time(value):
+    """ RFC 3339 text of a datetime or date for the bookmark payload, other values are returned as is """
+    if isinstance(value, datetime):
+        utc_offset = value.utcoffset()
+        if utc_offset is None:
+            # naive datetimes are written as UTC, whatever the local time zone, as jsons wrote them
+            offset = '+00:00'
+        elif value.tzname() in ('UTC', 'UTC+00:00'):
+            offset = 'Z'
+        else:
+            # a zero offset of another zone (GMT, Europe/London in winter) is written -00:00, as jsons did
+            offset_seconds = utc_offset.total_seconds()
+            offset = '{0}{1:02d}:{2:02d}'.format('+' if offset_seconds > 0 else '-',
+                                                 int(abs(offset_seconds) // 3600),
+                                                 int(abs(offset_seconds) // 60 % 60))
+        pattern = '%Y-%m-%dT%H:%M:%S.%f' if value.microsecond else '%Y-%m-%dT%H:%M:%S'
+        return value.strftime(pattern) + offset
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def _retry_after_seconds(value, default=1):
+    """ seconds to wait for a Retry-After header given in seconds or as an HTTP date, default when missing or unreadable """
+    if value is None:
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            return default
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return max(0.0, seconds) if math.isfinite(seconds) else default
+
+
 class BookmarkProperties():
     """
     This class holds properties for Hunting bookmark.
     Special Note:  For query_result_dict, actual value is the key, and the entity type is the value.
+    Inputs are validated at construction, fields are plain attributes afterwards.
     """
 
+    __slots__ = ('bookmarkId', 'displayName', 'labels', 'query', 'queryResult',
+                 'notes', 'eventTime', 'queryStartTime', 'queryEndTime')
+
     def __init__(self,
                  display_name,
                  query,
@@ -63,122 +117,47 @@ class BookmarkProperties():
                  event_time=None,
                  query_start_time=None,
                  query_end_time=None):
+        InputValidation.validate_input('display_name', display_name)
+        InputValidation.validate_input('query', query)
         self.displayName = display_name
-        self.labels = tag_list
+        self.labels = tag_list if tag_list else []
         self.query = query
-        self.queryResult = query_result_dict
+        self.queryResult = BookmarkProperties.query_result_json(query_result_dict)
         self.notes = notes
         self.eventTime = event_time
         self.queryStartTime = query_start_time
         self.queryEndTime = query_end_time
         self.bookmarkId = str(uuid.uuid4())
 
-    @property
-    def bookmarkId(self):
-        """ bookmarkId getter """
-        return self._bookmarkId
-
-    @bookmarkId.setter
-    def bookmarkId(self, bookmark_id):
-        """ bookmarkId setter """
-        self._bookmarkId = bookmark_id
-
-    @property
-    def displayName(self):
-        """ displayName getter """
-        return self._displayName
-
-    @displayName.setter
-    def displayName(self, display_name):
-        """ displayName setter """
-        InputValidation.validate_input('display_name', display_name)
-        self._displayName = display_name
-
-    @property
-    def labels(self):
-        """ labels getter """
-        return self._labels
-
-    @labels.setter
-    def labels(self, tag_list):
-        """ labels setter """
-        if tag_list:
-            self._labels = tag_list
-        else:
-            self._labels = []
-
-    @property
-    def query(self):
-        """ query """
-        return self._query
-
-    @query.setter
-    def query(self, query):
-        """ query setter """
-        InputValidation.validate_input('query', query)
-        self._query = query
-
-    @property
-    def queryResult(self):
-        """ queryResult """
-        return self._queryResult
-
-    @queryResult.setter
-    def queryResult(self, query_result):
-        """ queryResult setter """
-        result_str = None
+    @staticmethod
+    def query_result_json(query_result):
+        """ queryResult text for an entity mapping dict, '{}' unless every value is a known entity type """
         if query_result and isinstance(query_result, dict):
             if all(elem in Constants.ENTITY_TYPE for elem in list(query_result.values())):
-                query_result_dict = {}
-                query_result_dict.update({Constants.ENTITY_MAPPING: query_result})
-                result_str = jsons.dumps(query_result_dict)
-                self._queryResult = result_str
-        if not result_str:
-            self._queryResult = '{}'
-
-    @property
-    def notes(self):
-        """ notes getter """
-        return self._notes
-
-    @notes.setter
-    def notes(self, notes):
-        """ notes setter """
-        self._notes = notes
-
-    @property
-    def eventTime(self):
-        """ eventTime """
-        return self._eventTime
-
-    @eventTime.setter
-    def eventTime(self, event_time):
-        """ eventTime setter """
-        self._eventTime = event_time
-
-    @property
-    def queryStartTime(self):
-        """ queryStartTime """
-        return self._queryStartTime
-
-    @queryStartTime.setter
-    def queryStartTime(self, query_start_time):
-        """ queryStartTime setter """
-        self._queryStartTime = query_start_time
-
-    @property
-    def queryEndTime(self):
-        """ queryEndTime """
-        return self._queryEndTime
-
-    @queryEndTime.setter
-    def queryEndTime(self, query_end_time):
-        """ queryEndTime setter """
-        self._queryEndTime = query_end_time
+                return json.dumps({Constants.ENTITY_MAPPING: query_result})
+        return '{}'
+
+    def to_payload(self):
+        """ properties as the dict sent to the bookmark API, None values are left out """
+        payload = {'bookmarkId': self.bookmarkId,
+                   'displayName': self.displayName,
+                   'eventTime': _payload_time(self.eventTime),
+                   'labels': self.labels,
+                   'notes': self.notes,
+                   'query': self.query,
+                   'queryEndTime': _payload_time(self.queryEndTime),
+                   'queryResult': self.queryResult,
+                   'queryStartTime': _payload_time(self.queryStartTime)}
+        return {key: value for key, value in payload.items() if value is not None}
 
 
 class BookmarkModel():
-    """ This class holds data model for Bookmark """
+    """
+    This class holds data model for Bookmark.
+    The resource base is interned, so bookmarks of the same workspace share one string.
+    """
+
+    __slots__ = ('id', 'name', 'type', 'etag', 'properties', 'bookmark_resource_base')
 
     def __init__(self,
                  bookmark_name,
@@ -186,74 +165,109 @@ class BookmarkModel():
                  resource_group_name,
                  workspace_name,
                  bookmark_properties):
+        InputValidation.validate_input('bookmark_name', bookmark_name)
+        InputValidation.validate_input('bookmark_properties', bookmark_properties)
         self.name = bookmark_name
         self.type = Constants.TYPE
         self.etag = Constants.ETAG
         self.properties = bookmark_properties
-        self.bookmark_resource_base = Constants.BOOKMARK_RESOURCE_BASE.format(subscription_id, resource_group_name, workspace_name)
+        self.bookmark_resource_base = sys.intern(Constants.BOOKMARK_RESOURCE_BASE.format(subscription_id, resource_group_name, workspace_name))
         self.id = self.bookmark_resource_base + Constants.BOOKMARK_ID.format(bookmark_properties.bookmarkId)
 
-    @property
-    def id(self):
-        """ id getter """
-        return self._id
+    def to_payload(self):
+        """ bookmark as the dict sent to the bookmark API, None values are left out """
+        payload = {'etag': self.etag,
+                   'id': self.id,
+                   'name': self.name,
+                   'properties': self.properties.to_payload(),
+                   'type': self.type}
+        return {key: value for key, value in payload.items() if value is not None}
 
-    @id.setter
-    def id(self, bookmark_resource_id):
-        """ id setter """
-        self._id = bookmark_resource_id
 
-    @property
-    def name(self):
-        """ name getter """
-        return self._name
+class BookmarkResult():
+    """ This class holds the outcome of a bookmark request """
+
+    def __init__(self, ok, status_code=None, response=None, error=None, resource_id=None):
+        self.ok = ok
+        self.status_code = status_code
+        self.response = response
+        self.error = error
+        self.resource_id = resource_id
+
+    def json(self):
+        """ decoded response body, None if there is none """
+        if self.response is None or not self.response.content:
+            return None
+        return self.response.json()
+
+    def __repr__(self):
+        if self.ok:
+            return 'BookmarkResult(ok, {0})'.format(self.status_code)
+        return 'BookmarkResult(failed, {0}, {1})'.format(self.status_code, self.error)
+
+
+BookmarkRecord = namedtuple('BookmarkRecord', ['id', 'name', 'etag', 'display_name', 'query', 'query_result', 'notes', 'labels',
+                                               'event_time', 'query_start_time', 'query_end_time', 'created', 'updated'])
+BookmarkRecord.__doc__ = """ Lightweight read-only bookmark, as listed by BookmarkHelper.iter_bookmarks """
+BOOKMARK_TIME_FIELDS = ('event_time', 'query_start_time', 'query_end_time', 'created', 'updated')
+
+
+class _ThrottleGate():
+    """ Shared pause for concurrent workers, set when ARM throttles """
+
+    def __init__(self):
+        self._resume_at = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """ block until the pause is over """
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """ hold every worker for the given seconds """
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
 
-    @name.setter
-    def name(self, bookmark_name):
-        """ name setter """
-        InputValidation.validate_input('bookmark_name', bookmark_name)
-        self._name = bookmark_name
-
-    @property
-    def type(self):
-        """ type getter """
-        return self._type
-
-    @type.setter
-    def type(self, t):
-        """ type setter """
-        self._type = t
-
-    @property
-    def etag(self):
-        """ etag getter """
-        return self._etag
-
-    @etag.setter
-    def etag(self, etag):
-        """ etag setter """
-        self._etag = etag
-
-    @property
-    def properties(self):
-        """ properties getter """
-        return self._properties
-
-    @properties.setter
-    def properties(self, bookmark_properties):
-        """ properties setter """
-        InputValidation.validate_input('bookmark_properties', bookmark_properties)
-        self._properties = bookmark_properties
 
 # pylint: disable-msg=W0703
 class BookmarkHelper:
-    """ This class provides CRUD methods for bookmark """
+    """
+    This class provides CRUD methods for bookmark.
+    Requests go through one pooled requests.Session which retries throttled (429)
+    and failed (5xx) calls with backoff, honoring Retry-After.
+    """
 
     BOOKMARK_BASE_URL = 'https://management.azure.com'
     BOOKMARK_API_VERSION = '?api-version=2019-01-01-preview'
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    ARM_WRITES_REMAINING_HEADER = 'x-ms-ratelimit-remaining-subscription-writes'
 
-    def __init__(self, access_token):
+    def __init__(self, access_token, retries=5, backoff_factor=1, pool_maxsize=10, timeout=60, session=None):
         self.access_token = access_token
+        self.timeout = timeout
+        self.session = session or BookmarkHelper.create_session(retries, backoff_factor, pool_maxsize)
+
+    @staticmethod
+    def create_session(retries=5, backoff_factor=1, pool_maxsize=10):
+        """ Create a pooled session retrying throttled and failed requests """
+        retry_args = dict(total=retries,
+                          backoff_factor=backoff_factor,
+                          status_forcelist=BookmarkHelper.RETRY_STATUS_CODES,
+                          respect_retry_after_header=True,
+                          raise_on_status=False)
+        try:
+            retry = Retry(allowed_methods=frozenset(['GET', 'PUT', 'DELETE']), **retry_args)
+        except TypeError:
+            # urllib3 < 1.26
+            retry = Retry(method_whitelist=frozenset(['GET', 'PUT', 'DELETE']), **retry_args)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
 
     def _set_header(self):
         return {'Authorization': 'Bearer ' + self.access_token}
@@ -268,56 +282,172 @@ class BookmarkHelper:
         return self.BOOKMARK_BASE_URL + bookmark_model.id + self.BOOKMARK_API_VERSION
 
     def _generate_bookmark_payload(self, bookmark_model):
-        items = jsons.dump(bookmark_model, strip_privates=True)
-        return jsons.dump(self._cleanup_json(items))
-
-    def _cleanup_json(self, data):
-        """
-            Delete keys with the value ``None`` in a dictionary, recursively.
-            This alters the input so you may wish to ``copy`` the dict first.
-        """
-        for key, value in list(data.items()):
-            if key == 'bookmark_resource_base':
-                del data[key]
-            elif value is None:
-                del data[key]
-            elif isinstance(value, dict):
-                self._cleanup_json(value)
-
-        return data
+        return bookmark_model.to_payload()
 
+    def _send(self, method, url, **kwargs):
+        """ Send a request through the session, errors are returned in the BookmarkResult """
+        try:
+            with Instrumentation.span('BookmarkHelper.' + method) as span:
+                response = self.session.request(method, url, headers=self._set_header(), timeout=self.timeout, **kwargs)
+                span.add_bytes(len(response.content))
+        except requests.RequestException as e:
+            return BookmarkResult(False, error=str(e))
+
+        if response.ok:
+            return BookmarkResult(True, response.status_code, response)
+        return BookmarkResult(False, response.status_code, response,
+                              '{0} {1}: {2}'.format(response.status_code, response.reason, response.text[:500]))
+
+    @staticmethod
+    def _report(result):
+        print('Success' if result.ok else result.error)
+        return result
+
+    @Instrumentation.timed()
     def add_bookmark(self, bookmark_model):
         """ Create a hunting bookmark """
-        try:
-            result = requests.put(
-                self._set_rp_put_url(bookmark_model),
-                headers=self._set_header(),
-                json=self._generate_bookmark_payload(bookmark_model))
-            print('Success')
-            return result
-        except Exception as e:
-            print(str(e))
-
+        return self._report(self._send('PUT',
+                                       self._set_rp_put_url(bookmark_model),
+                                       json=self._generate_bookmark_payload(bookmark_model)))
+
+    def _add_bookmark_throttled(self, bookmark_model, gate, max_workers):
+        """ PUT one bookmark of a bulk upload, pausing all workers when ARM throttles """
+        gate.wait()
+        result = self._send('PUT',
+                            self._set_rp_put_url(bookmark_model),
+                            json=self._generate_bookmark_payload(bookmark_model))
+        result.resource_id = bookmark_model.id
+
+        if result.response is not None:
+            if result.status_code == 429:
+                gate.pause(_retry_after_seconds(result.response.headers.get('Retry-After')))
+            else:
+                remaining = result.response.headers.get(self.ARM_WRITES_REMAINING_HEADER)
+                if remaining is not None and remaining.isdigit() and int(remaining) <= max_workers:
+                    # close to the ARM write quota, let it refill
+                    gate.pause(1)
+        return result
+
+    @Instrumentation.timed()
+    def add_bookmarks(self, bookmark_models, max_workers=4, previous_results=None):
+        """
+        Create hunting bookmarks concurrently with up to max_workers uploads in flight.
+        Returns one BookmarkResult per model, in order.
+        To resume after a partial failure, pass the results of the previous call as previous_results:
+        bookmarks which already succeeded are not uploaded again.
+        Keep max_workers within pool_maxsize so every worker reuses a pooled connection.
+        """
+        bookmark_models = list(bookmark_models)
+        done = {result.resource_id: result for result in (previous_results or []) if result.ok}
+        gate = _ThrottleGate()
+
+        results = [done.get(bookmark_model.id) for bookmark_model in bookmark_models]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+                futures = {i: executor.submit(self._add_bookmark_throttled, bookmark_models[i], gate, max_workers)
+                           for i in pending}
+            for i, future in futures.items():
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    # one failed upload must not lose the results of the others
+                    results[i] = BookmarkResult(False, error=str(e), resource_id=bookmark_models[i].id)
+
+        failed = sum(1 for result in results if not result.ok)
+        print('{0} bookmarks created, {1} failed'.format(len(results) - failed, failed))
+        return results
+
+    @Instrumentation.timed()
     def get_bookmarks(self, bookmark_model):
-        """ Retrieve hunting bookmarks for workspace """
+        """ Retrieve the first page of hunting bookmarks for workspace, use iter_bookmarks to list all of them """
+        return self._report(self._send('GET', self._set_rp_get_url(bookmark_model)))
+
+    @staticmethod
+    def _to_record(item):
+        properties = item.get('properties') or {}
+        return BookmarkRecord(item.get('id'),
+                              item.get('name'),
+                              item.get('etag'),
+                              properties.get('displayName'),
+                              properties.get('query'),
+                              properties.get('queryResult'),
+                              properties.get('notes'),
+                              properties.get('labels') or [],
+                              properties.get('eventTime'),
+                              properties.get('queryStartTime'),
+                              properties.get('queryEndTime'),
+                              properties.get('created'),
+                              properties.get('updated'))
+
+    def iter_bookmark_pages(self, bookmark_model):
+        """
+        Generator of bookmark pages for workspace, each a list of BookmarkRecord.
+        The next page is only requested once the previous one has been consumed.
+        """
+        url = self._set_rp_get_url(bookmark_model)
+        while url:
+            result = self._send('GET', url)
+            if not result.ok:
+                raise requests.HTTPError(result.error, response=result.response)
+            page = result.json() or {}
+            yield [self._to_record(item) for item in page.get('value') or []]
+            url = page.get('nextLink')
+
+    def iter_bookmarks(self, bookmark_model):
+        """ Generator of all hunting bookmarks for workspace as BookmarkRecord, following nextLink lazily """
+        for page in self.iter_bookmark_pages(bookmark_model):
+            for record in page:
+                yield record
+
+    def iter_bookmark_frames(self, bookmark_model, chunk_size=1000):
+        """ Generator of DataFrames of at most chunk_size bookmarks, so that only one chunk is held in memory """
+        import pandas as pd
+
+        def to_frame(records):
+            data_frame = pd.DataFrame.from_records(records, columns=BookmarkRecord._fields)
+            for field in BOOKMARK_TIME_FIELDS:
+                data_frame[field] = pd.to_datetime(data_frame[field], utc=True, errors='coerce')
+            return data_frame
+
+        chunk = []
+        for record in self.iter_bookmarks(bookmark_model):
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield to_frame(chunk)
+                chunk = []
+        if chunk:
+            yield to_frame(chunk)
+
+    @Instrumentation.timed()
+    def write_bookmarks_parquet(self, bookmark_model, path, chunk_size=1000):
+        """ Stream all hunting bookmarks for workspace into a Parquet file chunk by chunk, requires pyarrow """
         try:
-            result = requests.get(
-                self._set_rp_get_url(bookmark_model),
-                headers=self._set_header())
-            print('Success')
-            return result
-        except Exception as e:
-            print(str(e))
-
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('write_bookmarks_parquet requires pyarrow, run: pip install pyarrow')
+
+        fields = []
+        for field in BookmarkRecord._fields:
+            if field in BOOKMARK_TIME_FIELDS:
+                fields.append(pa.field(field, pa.timestamp('ns', tz='UTC')))
+            elif field == 'labels':
+                fields.append(pa.field(field, pa.list_(pa.string())))
+            else:
+                fields.append(pa.field(field, pa.string()))
+        schema = pa.schema(fields)
+
+        rows = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            for data_frame in self.iter_bookmark_frames(bookmark_model, chunk_size):
+                writer.write_table(pa.Table.from_pandas(data_frame, schema=schema, preserve_index=False))
+                rows += len(data_frame)
+        return rows
+
+    @Instrumentation.timed()
     def delete_bookmark(self, bookmark_model):
         """ Delete a hunting bookmark, not recommend for notebook users """
-        try:
-            result = requests.delete(
-                self._set_rp_delete_url(bookmark_model),
-                headers=self._set_header())
-            print('Success')
-            return result
-        except Exception as e:
-            print(str(e))
+        return self._report(self._send('DELETE', self._set_rp_delete_url(bookmark_model)))
 
 # end of the class
@@ -1,10 +1,21 @@
 # pylint: disable-msg=C0103
 """
 SentinelUtils: This package provides utility methods in general
+Members are imported on first access.
 """
 
 # __init__.py
-from .config_reader import ConfigReader
-from .version_management import VersionInformation, ModuleVersionCheck
-from .obfuscation_utility import ObfuscationUtility
-from .input_validation import InputValidation
+from .lazy_import import lazy_exports
+
+_EXPORTS = {
+    'ConfigReader': '.config_reader',
+    'VersionInformation': '.version_management',
+    'ModuleVersionCheck': '.version_management',
+    'ObfuscationUtility': '.obfuscation_utility',
+    'QueryResultDecoder': '.query_result_decoder',
+    'Instrumentation': '.instrumentation',
+    'InputValidation': '.input_validation'
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
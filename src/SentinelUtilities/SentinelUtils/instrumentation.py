@@ -0,0 +1,163 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Instrumentation:
+This module records wall time, call counts and bytes of named spans,
+summarized in memory and exportable as JSON or as a Chrome trace (chrome://tracing, Perfetto).
+It is disabled by default, or enabled by the SENTINEL_INSTRUMENTATION environment variable.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan():
+    """ span handed out while instrumentation is disabled """
+
+    active = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def add_bytes(self, nbytes):
+        """ nothing recorded """
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span():
+    """ one timed section, recorded on exit """
+
+    active = True
+
+    def __init__(self, name, nbytes):
+        self.name = name
+        self.nbytes = nbytes
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        Instrumentation.record(self.name, self.start, time.perf_counter(), self.nbytes)
+        return False
+
+    def add_bytes(self, nbytes):
+        """ count bytes handled within the span """
+        self.nbytes += nbytes
+
+
+class Instrumentation():
+    """
+    Process wide span recorder.
+    Use Instrumentation.span(name) as a context manager or Instrumentation.timed(name) as a decorator;
+    while disabled both cost one attribute check.
+    """
+
+    enabled = os.environ.get('SENTINEL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes')
+    max_events = 100000
+
+    _stats = {}
+    _events = []
+    _origin = time.perf_counter()
+    _lock = threading.Lock()
+
+    @classmethod
+    def enable(cls):
+        """ start recording spans """
+        cls.enabled = True
+
+    @classmethod
+    def disable(cls):
+        """ stop recording spans, what was recorded is kept """
+        cls.enabled = False
+
+    @classmethod
+    def reset(cls):
+        """ drop what was recorded """
+        with cls._lock:
+            cls._stats = {}
+            cls._events = []
+            cls._origin = time.perf_counter()
+
+    @classmethod
+    def span(cls, name, nbytes=0):
+        """ context manager timing the enclosed block under name """
+        if not cls.enabled:
+            return _NULL_SPAN
+        return _Span(name, nbytes)
+
+    @classmethod
+    def timed(cls, name=None):
+        """ decorator timing every call of the function under name, by default its qualified name """
+
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not cls.enabled:
+                    return func(*args, **kwargs)
+                with _Span(span_name, 0):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def record(cls, name, start, end, nbytes=0):
+        """ add a finished span """
+        duration = end - start
+        with cls._lock:
+            stats = cls._stats.get(name)
+            if stats is None:
+                stats = cls._stats[name] = {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'bytes': 0}
+            stats['count'] += 1
+            stats['total_seconds'] += duration
+            stats['max_seconds'] = max(stats['max_seconds'], duration)
+            stats['bytes'] += nbytes
+            if len(cls._events) < cls.max_events:
+                cls._events.append((name, start, duration, threading.get_ident(), nbytes))
+
+    @classmethod
+    def summary(cls):
+        """ per-span count, total / mean / max seconds and bytes, by descending total time """
+        with cls._lock:
+            items = [(name, dict(stats)) for name, stats in cls._stats.items()]
+        items.sort(key=lambda item: item[1]['total_seconds'], reverse=True)
+        for _, stats in items:
+            stats['mean_seconds'] = stats['total_seconds'] / stats['count']
+        return dict(items)
+
+    @classmethod
+    def export_json(cls, path):
+        """ write the summary and the recorded spans as JSON """
+        with cls._lock:
+            events = [{'name': name, 'start_seconds': start - cls._origin, 'seconds': duration, 'thread': thread, 'bytes': nbytes}
+                      for name, start, duration, thread, nbytes in cls._events]
+        with open(path, 'w') as json_file:
+            json.dump({'summary': cls.summary(), 'spans': events}, json_file, indent=1)
+
+    @classmethod
+    def export_chrome_trace(cls, path):
+        """ write the recorded spans in the Chrome trace event format """
+        pid = os.getpid()
+        with cls._lock:
+            events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': thread,
+                       'ts': round((start - cls._origin) * 1e6, 3), 'dur': round(duration * 1e6, 3),
+                       'args': {'bytes': nbytes}}
+                      for name, start, duration, thread, nbytes in cls._events]
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+# end of the class
@@ -0,0 +1,42 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Lazy Import:
+This module lets the package __init__ modules import their members on first access (PEP 562),
+so importing a package does not pay for pandas, azure or ipywidgets until they are used.
+"""
+
+import importlib
+
+
+def lazy_exports(package_name, exports):
+    """
+    Module level __getattr__ and __dir__ for a package.
+    exports maps each public name to the submodule defining it, e.g. {'ConfigReader': '.config_reader'}.
+    Submodules are reachable as attributes too, as they were with eager imports.
+    """
+
+    package = importlib.import_module(package_name)
+
+    def __getattr__(name):
+        if name in exports:
+            value = getattr(importlib.import_module(exports[name], package_name), name)
+        else:
+            try:
+                value = importlib.import_module('.' + name, package_name)
+            except ModuleNotFoundError as err:
+                if err.name != package_name + '.' + name:
+                    raise
+                raise AttributeError('module {0!r} has no attribute {1!r}'.format(package_name, name)) from None
+        setattr(package, name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(package)) | set(exports))
+
+    return __getattr__, __dir__
+
+# End of the Module #
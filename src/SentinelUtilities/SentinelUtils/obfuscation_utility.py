@@ -8,13 +8,37 @@ obfuscation_utility module:
 This module provides obfuscation functionalities
 """
 
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 from cryptography.fernet import Fernet
 
 
+def _encrypt_values(seed, values):
+    """ Fernet tokens (str) of a list of str, run in worker processes """
+    fernet = Fernet(seed)
+    return [fernet.encrypt(value.encode('utf-8')).decode('ascii') for value in values]
+
+
+def _decrypt_values(seed, tokens):
+    """ plain texts of a list of Fernet tokens (str), run in worker processes """
+    fernet = Fernet(seed)
+    return [fernet.decrypt(token.encode('ascii')).decode('utf-8') for token in tokens]
+
+
 class ObfuscationUtility():
-    """ This class provides utility methods for obfuscation """
+    """
+    This class provides utility methods for obfuscation.
+    Column methods encrypt each distinct value once, so equal values get equal tokens within a call,
+    and spread the distinct values over worker processes when there are at least PARALLEL_MIN_VALUES of them.
+    """
+
+    PARALLEL_MIN_VALUES = 100000
+
     def __init__(self, seed):
         self.seed = seed
+        self._fernet = None
+        self._fernet_seed = None
 
     @staticmethod
     def generate_seed():
@@ -22,16 +46,73 @@ class ObfuscationUtility():
 
         return Fernet.generate_key()
 
+    @property
+    def fernet(self):
+        """ Fernet cipher of the seed, created once """
+
+        if self._fernet is None or self._fernet_seed != self.seed:
+            self._fernet = Fernet(self.seed)
+            self._fernet_seed = self.seed
+        return self._fernet
+
     def obfuscate_text(self, text):
         """ Obfuscate input text using key """
 
-        fernet = Fernet(self.seed)
-        en_text = fernet.encrypt(text)
+        en_text = self.fernet.encrypt(text)
         return en_text
 
     def deobfuscate_text(self, en_text):
         """ De-obfuscate input text using key """
 
-        fernet = Fernet(self.seed)
-        re_text = fernet.decrypt(en_text)
+        re_text = self.fernet.decrypt(en_text)
         return re_text.decode('utf-8')
+
+    def _map_distinct(self, series, func, max_workers):
+        """ apply func(seed, values) to the distinct non-null values of series and map the results back """
+
+        # imported here, Log and AnomalyQueries use this module for text only
+        import numpy as np # pylint: disable=import-outside-toplevel
+        import pandas as pd # pylint: disable=import-outside-toplevel
+
+        codes, uniques = pd.factorize(series)
+        values = [str(value) for value in uniques]
+
+        workers = max_workers or os.cpu_count() or 1
+        if workers > 1 and len(values) >= ObfuscationUtility.PARALLEL_MIN_VALUES:
+            chunk_size = -(-len(values) // (workers * 4))
+            chunks = [values[i:i + chunk_size] for i in range(0, len(values), chunk_size)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = [item for chunk in executor.map(func, [self.seed] * len(chunks), chunks) for item in chunk]
+        else:
+            results = func(self.seed, values)
+
+        # nulls have code -1, which picks the trailing None
+        mapped = np.empty(len(results) + 1, dtype=object)
+        mapped[:len(results)] = results
+        return pd.Series(mapped[codes], index=series.index, name=series.name)
+
+    def obfuscate_series(self, series, max_workers=None):
+        """ Obfuscate every value of a Series as str, nulls are kept """
+
+        return self._map_distinct(series, _encrypt_values, max_workers)
+
+    def deobfuscate_series(self, series, max_workers=None):
+        """ De-obfuscate a Series of tokens made by obfuscate_series """
+
+        return self._map_distinct(series, _decrypt_values, max_workers)
+
+    def obfuscate_dataframe(self, data_frame, columns, max_workers=None):
+        """ Copy of the DataFrame with the given columns obfuscated """
+
+        data_frame = data_frame.copy()
+        for column in columns:
+            data_frame[column] = self.obfuscate_series(data_frame[column], max_workers)
+        return data_frame
+
+    def deobfuscate_dataframe(self, data_frame, columns, max_workers=None):
+        """ Copy of the DataFrame with the given columns de-obfuscated """
+
+        data_frame = data_frame.copy()
+        for column in columns:
+            data_frame[column] = self.deobfuscate_series(data_frame[column], max_workers)
+        return data_frame
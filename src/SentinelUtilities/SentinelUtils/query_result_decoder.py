@@ -0,0 +1,66 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Query Result Decoder:
+This module converts Log Analytics query result tables into typed DataFrames.
+"""
+
+import json
+import pandas as pd
+
+
+# pylint: disable-msg=R0903
+class QueryResultDecoder():
+    """
+    Builds a DataFrame column by column from a query result table,
+    applying the Log Analytics column types.
+    A table is the client model (.columns, .rows) or its dict form.
+    """
+
+    @staticmethod
+    def _field(item, name):
+        return item[name] if isinstance(item, dict) else getattr(item, name)
+
+    @staticmethod
+    def _decode_dynamic(value):
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except ValueError:
+                return value
+        return value
+
+    @staticmethod
+    def decode_column(values, col_type):
+        """ Convert the raw values of one column according to its Log Analytics type """
+
+        if col_type == 'datetime':
+            return pd.to_datetime(pd.Series(values, dtype=object), utc=True, errors='coerce')
+        if col_type in ('long', 'int'):
+            return pd.Series(values, dtype='Int64' if None in values else 'int64')
+        if col_type in ('real', 'decimal'):
+            return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype('float64')
+        if col_type == 'bool':
+            return pd.Series(values, dtype='boolean')
+        if col_type == 'dynamic':
+            return pd.Series([QueryResultDecoder._decode_dynamic(value) for value in values], dtype=object)
+        return pd.Series(values, dtype=object)
+
+    @staticmethod
+    def to_dataframe(table):
+        """ Decode a query result table into a DataFrame """
+
+        columns = QueryResultDecoder._field(table, 'columns')
+        rows = QueryResultDecoder._field(table, 'rows') or []
+        names = [QueryResultDecoder._field(col, 'name') for col in columns]
+        types = [QueryResultDecoder._field(col, 'type') for col in columns]
+
+        data = {}
+        for i, (name, col_type) in enumerate(zip(names, types)):
+            data[name] = QueryResultDecoder.decode_column([row[i] for row in rows], col_type)
+        return pd.DataFrame(data)
+
+# end of the class
@@ -10,7 +10,16 @@ that are required by Microsoft Sentinel Notebooks.
 """
 
 import sys
-import pkg_resources
+
+from packaging.requirements import Requirement
+from packaging.utils import canonicalize_name
+from packaging.version import InvalidVersion, Version
+
+try:
+    from importlib import metadata as importlib_metadata
+except ImportError:
+    # Python 3.7
+    import importlib_metadata
 
 # pylint: disable-msg=R0903
 class VersionInformation:
@@ -36,38 +45,48 @@ class ModuleVersionCheck:
         version.message = VersionInformation.name + required_version + ' is required' if not VersionInformation.requirement_met else ''
         return version
 
-    # pylint: disable-msg=W0702
+    @staticmethod
+    def build_distribution_index():
+        """ installed distribution versions keyed by canonical project name, the first one on sys.path wins """
+        index = {}
+        for dist in importlib_metadata.distributions():
+            name = dist.metadata['Name']
+            if name:
+                index.setdefault(canonicalize_name(name), dist.version)
+        return index
+
     def validate_installed_modules(self, module_list):
         """ validating installed modules' version """
+        index = ModuleVersionCheck.build_distribution_index()
         module_versions = []
         for mod_info in module_list:
             version = VersionInformation()
-            version.name, version.required_version = mod_info.split(">=")
-            try:
-                pkg_resources.require(mod_info)
-                version.requirement_met = True
-            except:
+            requirement = Requirement(mod_info)
+            if '>=' in mod_info and len(requirement.specifier) == 1:
+                version.name, version.required_version = mod_info.split(">=")
+            else:
+                version.name, version.required_version = requirement.name, str(requirement.specifier)
+
+            version = self.get_version_information(version, mod_info, index)
+            if not version.current_version:
                 version.requirement_met = False
+                version.message = 'DistributionNotFound: {0} is not installed'.format(requirement.name)
+            else:
                 try:
-                    version.message = str(sys.exc_info()[0].report)
-                except:
-                    version.message = 'Unknown error'
-            finally:
-                if 'azure' in version.name and version.message.find("VersionConflict") >= 0:
-                    version.requirement_met = True
-                elif version.message == '' or version.message.find("DistributionNotFound") < 0:
-                    version = self.get_version_information(version, mod_info)
+                    version.requirement_met = requirement.specifier.contains(Version(version.current_version), prereleases=True)
+                except InvalidVersion:
+                    version.requirement_met = False
+                if not version.requirement_met:
+                    version.message = 'VersionConflict: {0} {1} is installed, {2} is required'.format(requirement.name, version.current_version, mod_info)
 
             module_versions.append(version)
         return module_versions
 
-    # pylint: disable-msg=W0613
-    def get_version_information(self, version, mod_info):
+    def get_version_information(self, version, mod_info, index=None):
         """ get version information """
-        mod_list = pkg_resources.WorkingSet()
-        items = list(filter(lambda x: x.project_name.startswith(version.name), mod_list))
-        if not items:
-            version.current_version = items[0].version
+        if index is None:
+            index = ModuleVersionCheck.build_distribution_index()
+        version.current_version = index.get(canonicalize_name(Requirement(mod_info).name), '')
         return version
 
 # end of the class
@@ -1,7 +1,17 @@
 # pylint: disable-msg=C0103
 """
 SentinelWidgets: This package provides helper functionalities for UI comonents.
+Members are imported on first access.
 """
 
 # __init__.py
-from .widget_view_helper import *
+from SentinelUtils.lazy_import import lazy_exports
+
+_EXPORTS = {
+    'WidgetViewHelper': '.widget_view_helper',
+    'AsyncOptionLoader': '.async_option_loader',
+    'VmInventory': '.vm_inventory'
+}
+
+__all__ = list(_EXPORTS)
+__getattr__, __dir__ = lazy_exports(__name__, _EXPORTS)
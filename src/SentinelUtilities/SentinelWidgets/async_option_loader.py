@@ -0,0 +1,162 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+Async Option Loader:
+This module fills the options of selector widgets from background threads,
+so a widget is displayed right away and the backend list call does not block the kernel.
+"""
+
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncOptionLoader():
+    """
+    Loads widget options in the background.
+    Results are cached per backend object (held weakly) and key, shared by every widget asking
+    for the same list of the same backend, and reloaded on the first load after ttl seconds.
+    Refilling a widget makes its previous load stale: a stale result is never applied,
+    and a stale load nobody else waits for is cancelled if it has not started yet.
+    """
+
+    LOADING_TEXT = 'Loading...'
+    max_workers = 4
+    ttl = 600
+
+    _executor = None
+    _futures = weakref.WeakKeyDictionary()
+    _subscribers = weakref.WeakKeyDictionary()
+    _widget_loads = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_executor(cls):
+        if cls._executor is None:
+            cls._executor = ThreadPoolExecutor(max_workers=cls.max_workers)
+        return cls._executor
+
+    @classmethod
+    def load(cls, owner, key, func, *args):
+        """
+        Future of func(*args), shared by every caller using the same backend object owner and key
+        until it fails, expires or is invalidated
+        """
+        now = time.time()
+        with cls._lock:
+            futures = cls._futures.setdefault(owner, {})
+            for expired in [k for k, (created_at, _) in futures.items() if now - created_at >= cls.ttl]:
+                del futures[expired]
+            future = futures[key][1] if key in futures else None
+            if future is None or future.cancelled() or (future.done() and future.exception() is not None):
+                future = cls._get_executor().submit(func, *args)
+                futures[key] = (now, future)
+            return future
+
+    @classmethod
+    def invalidate(cls, owner=None, key=None):
+        """ Forget the cached results of a backend object, or one of them, or all of them, so the next load calls the backend again """
+        with cls._lock:
+            if owner is None:
+                cls._futures.clear()
+            elif key is None:
+                cls._futures.pop(owner, None)
+            else:
+                cls._futures.get(owner, {}).pop(key, None)
+
+    @classmethod
+    def _release(cls, owner, key, future):
+        """
+        drop one subscriber of a load, returns the future to cancel when it was the last one;
+        called under the lock, the caller cancels it after releasing the lock since cancel runs the callbacks
+        """
+        subscribers = cls._subscribers.setdefault(owner, {})
+        subscribers[key] = subscribers.get(key, 1) - 1
+        if subscribers[key] > 0:
+            return None
+        del subscribers[key]
+        futures = cls._futures.get(owner, {})
+        if future is not None and not future.running() and not future.done() and key in futures and futures[key][1] is future:
+            del futures[key]
+            return future
+        return None
+
+    @classmethod
+    def fill(cls, widget, owner, key, func, *args):
+        """
+        Show the loading state in the widget, then set its options to the result of func(*args),
+        loaded once per backend object owner and key.
+        Returns the future of the load.
+        """
+        stale = None
+        with cls._lock:
+            previous = cls._widget_loads.get(widget)
+            same_load = previous is not None and previous[1] is owner and previous[2] == key
+            if previous is not None and not same_load:
+                stale = cls._release(previous[1], previous[2], previous[3])
+            generation = previous[0] + 1 if previous is not None else 1
+            if not same_load:
+                subscribers = cls._subscribers.setdefault(owner, {})
+                subscribers[key] = subscribers.get(key, 0) + 1
+
+            cls._widget_loads[widget] = (generation, owner, key, None)
+        if stale is not None:
+            stale.cancel()
+
+        future = cls.load(owner, key, func, *args)
+        with cls._lock:
+            cls._widget_loads[widget] = (generation, owner, key, future)
+
+        if not future.done():
+            widget.disabled = True
+            widget.options = [cls.LOADING_TEXT]
+
+        def apply(done):
+            with cls._lock:
+                current = cls._widget_loads.get(widget)
+                if current is None or current[0] != generation:
+                    return
+            if done.cancelled():
+                return
+            error = done.exception()
+            if error is not None:
+                widget.options = ['Failed: {0}'.format(error)]
+                return
+            options = list(done.result())
+            widget.options = options
+            if options and not isinstance(widget.value, tuple):
+                # dropdowns select the first option, as the blocking selectors do
+                widget.value = options[0]
+            widget.disabled = False
+
+        future.add_done_callback(apply)
+        return future
+
+    @classmethod
+    def is_placeholder(cls, value):
+        """ True for the values shown while loading or after a failure """
+        return not value or value == cls.LOADING_TEXT or str(value).startswith('Failed: ')
+
+    @classmethod
+    def follow(cls, widget, upstream, refill):
+        """
+        Call refill(value) with the upstream widget value now and whenever it changes to a real selection,
+        the widget shows the loading state until the upstream widget has one
+        """
+
+        def on_change(change):
+            if not cls.is_placeholder(change.new):
+                refill(change.new)
+
+        upstream.observe(on_change, 'value')
+        if not cls.is_placeholder(upstream.value):
+            refill(upstream.value)
+        else:
+            widget.disabled = True
+            widget.options = [cls.LOADING_TEXT]
+
+# end of the class
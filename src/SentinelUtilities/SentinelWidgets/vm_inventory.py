@@ -0,0 +1,106 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+VM Inventory:
+This module prefetches the VMs of a compute backend and the disks of each VM,
+so the VM and managed disk selectors do not wait on a backend call per selection.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class VmInventory():
+    """
+    VM and disk index of a compute backend (get_vm_list(), get_vm_disk_names(vm_name)).
+    The VM list is read in pages of page_size; the disks of each page are requested concurrently
+    while the next page is read. Disk names are indexed by VM name.
+    The inventory is reloaded on the first access after ttl seconds.
+    """
+
+    def __init__(self, compute, ttl=600, page_size=100, max_workers=8):
+        self.compute = compute
+        self.ttl = ttl
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._built_at = 0
+        self._vm_names = []
+        self._disks = {}
+        self._listed = None
+        self._error = None
+        self.refresh()
+
+    def refresh(self):
+        """ start reloading the inventory in the background """
+        with self._lock:
+            self._built_at = time.time()
+            self._vm_names = []
+            self._disks = {}
+            self._error = None
+            self._listed = threading.Event()
+            listed = self._listed
+        threading.Thread(target=self._prefetch, args=(listed,), daemon=True).start()
+
+    def _prefetch(self, listed):
+        page = []
+        try:
+            for vm in self.compute.get_vm_list():
+                page.append(vm.name)
+                if len(page) >= self.page_size:
+                    self._add_page(page, listed)
+                    page = []
+            self._add_page(page, listed)
+        except Exception as err: # pylint: disable=broad-except
+            with self._lock:
+                if listed is self._listed:
+                    self._error = err
+        finally:
+            listed.set()
+
+    def _add_page(self, page, listed):
+        futures = {vm_name: self._executor.submit(self.compute.get_vm_disk_names, vm_name) for vm_name in page}
+        with self._lock:
+            if listed is not self._listed:
+                # a newer refresh replaced this one
+                return
+            self._vm_names.extend(page)
+            self._disks.update(futures)
+
+    def _check_fresh(self):
+        if time.time() - self._built_at >= self.ttl:
+            self.refresh()
+
+    def vm_names(self):
+        """ sorted VM names, waits for the VM list to be read """
+        self._check_fresh()
+        listed = self._listed
+        listed.wait()
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            return sorted(self._vm_names)
+
+    def disk_names(self, vm_name):
+        """ disk names of a VM, from the prefetched index, or from the backend for a VM not listed yet """
+        self._check_fresh()
+        with self._lock:
+            future = self._disks.get(vm_name)
+            if future is None:
+                future = self._executor.submit(self.compute.get_vm_disk_names, vm_name)
+                self._disks[vm_name] = future
+        return future.result()
+
+    def is_ready(self):
+        """ True once the VM list and every disk lookup have finished """
+        if not self._listed.is_set():
+            return False
+        with self._lock:
+            return all(future.done() for future in self._disks.values())
+
+# end of the class
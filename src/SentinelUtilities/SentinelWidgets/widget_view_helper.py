@@ -11,6 +11,7 @@ This module provides helper methods for UI controls and components.
 import os
 import ipywidgets as widgets
 from IPython.display import HTML
+from .async_option_loader import AsyncOptionLoader
 
 # pylint: disable-msg=R0904
 # pylint: disable-msg=E0602
@@ -50,15 +51,21 @@ class WidgetViewHelper():
         return env_dict
 
     @staticmethod
-    def select_vm(compute):
-        """ Select a VM """
-        vm_names = sorted(list(vm.name for vm in list(compute.get_vm_list())))
+    def select_vm(compute, inventory=None):
+        """ Select a VM, from the VmInventory of compute when given """
+        if inventory is not None:
+            vm_names = inventory.vm_names()
+        else:
+            vm_names = sorted(list(vm.name for vm in list(compute.get_vm_list())))
         return widgets.Dropdown(options=vm_names, value=vm_names[0], description='VM:')
 
     @staticmethod
-    def select_managed_disk(compute, vm_name):
-        """ Select a managed disk """
-        disk_list = compute.get_vm_disk_names(vm_name)
+    def select_managed_disk(compute, vm_name, inventory=None):
+        """ Select a managed disk, from the VmInventory of compute when given """
+        if inventory is not None:
+            disk_list = inventory.disk_names(vm_name)
+        else:
+            disk_list = compute.get_vm_disk_names(vm_name)
         return widgets.Dropdown(options=disk_list, value=disk_list[0], description='Disk:')
 
     @staticmethod
@@ -139,6 +146,67 @@ class WidgetViewHelper():
                                       value=[],
                                       description='Tables:')
 
+    @staticmethod
+    def select_vm_async(compute):
+        """ Select a VM, the list is loaded in the background """
+        vm_list = widgets.Dropdown(description='VM:')
+        AsyncOptionLoader.fill(vm_list, compute, 'vm_list',
+                               lambda: sorted(vm.name for vm in compute.get_vm_list()))
+        return vm_list
+
+    @staticmethod
+    def select_managed_disk_async(compute, vm):
+        """ Select a managed disk of a VM name, or of the VM selected in a VM dropdown, loaded in the background """
+        disk_list = widgets.Dropdown(description='Disk:')
+
+        def refill(vm_name):
+            AsyncOptionLoader.fill(disk_list, compute, ('vm_disks', vm_name), compute.get_vm_disk_names, vm_name)
+
+        if isinstance(vm, widgets.Widget):
+            AsyncOptionLoader.follow(disk_list, vm, refill)
+        else:
+            refill(vm)
+        return disk_list
+
+    @staticmethod
+    def select_storage_account_async(storage, resource_group_for_storage):
+        """ Select a storage account, the list is loaded in the background """
+        storage_account_list = widgets.Dropdown(description='Existing Storage Accounts:')
+        AsyncOptionLoader.fill(storage_account_list, storage, ('storage_accounts', resource_group_for_storage),
+                               storage.get_storage_account_names, resource_group_for_storage)
+        return storage_account_list
+
+    @staticmethod
+    def select_blob_container_async(storage, resource_group_for_storage, storage_account):
+        """ Select a blob container of a storage account name, or of the account selected in a dropdown, loaded in the background """
+        blob_container_list = widgets.Dropdown(description='Blob Containers:')
+
+        def refill(storage_account_name):
+            AsyncOptionLoader.fill(blob_container_list,
+                                   storage, ('blob_containers', resource_group_for_storage, storage_account_name),
+                                   storage.get_container_name_list, resource_group_for_storage, storage_account_name, None)
+
+        if isinstance(storage_account, widgets.Widget):
+            AsyncOptionLoader.follow(blob_container_list, storage_account, refill)
+        else:
+            refill(storage_account)
+        return blob_container_list
+
+    @staticmethod
+    def select_log_analytics_workspace_async(loganalytics):
+        """ Select a LA workspace, the list is loaded in the background """
+        workspace_list = widgets.Dropdown(description='Workspace:')
+        AsyncOptionLoader.fill(workspace_list, loganalytics, 'workspaces', loganalytics.get_workspace_name_list)
+        return workspace_list
+
+    @staticmethod
+    def select_multiple_tables_async(anomaly_lookup):
+        """ Select data tables, the list is loaded in the background """
+        table_list = widgets.SelectMultiple(value=[], description='Tables:')
+        AsyncOptionLoader.fill(table_list, anomaly_lookup, 'tables',
+                               lambda: sorted(anomaly_lookup.query_table_list().SentinelTableName.tolist()))
+        return table_list
+
     @staticmethod
     def generate_upload_container_path(storage, os_type, sas_expiration_in_days):
         """ Generate a upload container path """
@@ -9,7 +9,9 @@ import setuptools
 INSTALL_REQUIRES = ['azure-loganalytics>=0.1.0', 
                     'azure-mgmt-loganalytics>=0.2.0',
                     'azure-common>=1.1.25',
-                    'azure-cli-core>=2.7.0'
+                    'azure-cli-core>=2.7.0',
+                    'packaging>=17.0',
+                    'importlib-metadata>=1.0;python_version<"3.8"'
                     ]
 
 with open("LICENSE.txt", "r") as fh:
@@ -26,11 +28,11 @@ setuptools.setup(
     report bugs, and suggets for new features.",
     license=LICENSE_TXT,
     url="https://github.com/Azure/Azure-Sentinel",
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     packages=setuptools.find_packages(),
     classifiers=[
         "License :: OSI Approved :: MIT License",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
         "Operating System :: OS Independent",
     ],
     install_requires=INSTALL_REQUIRES,
@@ -0,0 +1,100 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+fake_log_analytics:
+This module provides an in-process Log Analytics data client answering the Anomaly Lookup queries,
+for the tests.
+"""
+
+import re
+import threading
+from collections import namedtuple
+
+Column = namedtuple('Column', ['name', 'type'])
+Table = namedtuple('Table', ['name', 'columns', 'rows'])
+QueryResults = namedtuple('QueryResults', ['tables'])
+
+ANOMALY_COLUMNS = [('qEntity', 'string'), ('qTimestamp', 'datetime'), ('minTimestamp', 'datetime'),
+                   ('maxTimestamp', 'datetime'), ('delta', 'timespan'), ('Table', 'string'),
+                   ('entCol', 'string'), ('colName', 'string'), ('colVal', 'string'), ('colType', 'string'),
+                   ('expectedCount', 'real'), ('actualCount', 'long'), ('anomalyScore', 'real')]
+
+
+def query_results(columns, rows):
+    """ a query result holding one table """
+    return QueryResults([Table('PrimaryResult', [Column(name, col_type) for name, col_type in columns], rows)])
+
+
+class FakeLogAnalyticsClient():
+    """
+    Answers the Anomaly Lookup queries of tables T1, T2 and T3.
+    Entities starting with '1.' are found in T1 and T2, in column IP, first_day days or
+    first_hour hours (when given) after the query timestamp; these can also be collections
+    of the day or hour buckets holding the entity. Column c1 is categorical.
+    Queries on a table of fail_tables, or every query with error, raise error.
+    """
+
+    TABLES = ['T1', 'T2', 'T3']
+
+    def __init__(self, first_day=-10, first_hour=None, fail_tables=(), error=None):
+        self.first_day = first_day
+        self.first_hour = first_hour
+        self.fail_tables = set(fail_tables)
+        self.error = error
+        self.queries = []
+        self._lock = threading.Lock()
+
+    # pylint: disable=too-many-return-statements
+    def query(self, workspace_id, body): # pylint: disable=unused-argument
+        """ the result of a query """
+        query = body.query
+        with self._lock:
+            self.queries.append(query)
+        if self.error is not None and (not self.fail_tables or any(tbl in query for tbl in self.fail_tables)):
+            raise self.error
+
+        if 'distinct SentinelTableName' in query:
+            return query_results([('SentinelTableName', 'string')], [[tbl] for tbl in self.TABLES])
+        if 'make-series' in query:
+            return query_results(ANOMALY_COLUMNS, [[
+                re.search(r"qEntity = '([^']+)'", query).group(1), '2020-01-01T00:00:00Z',
+                '2019-12-20T00:00:00Z', '2020-01-02T00:00:00Z', '1.00:00:00',
+                re.search(r"Table = '(\w+)'", query).group(1), 'IP',
+                re.search(r"colName = '(\w+)'", query).group(1), 'val', 'string', 1.5, 10, 3.2]])
+        window = re.search(r"indDate \+ (-?\d+)([dh]) and \$IngestionTime<indDate \+ (-?\d+)", query)
+        if window:
+            from_unit, unit, to_unit = int(window.group(1)), window.group(2), int(window.group(3))
+            buckets = self.first_day if unit == 'd' else self.first_hour
+            if buckets is None:
+                buckets = ()
+            elif isinstance(buckets, int):
+                buckets = (buckets,)
+            found = any(from_unit <= bucket < to_unit for bucket in buckets)
+            return query_results([('ing', 'datetime')], [['2020-01-01T00:00:00Z']] if found else [])
+        if query.startswith('union ('):
+            probes = re.findall(r"\((\w+) \| where .*? search '([^']+)' \| take 1 \| extend SentinelBatchIndex = (\d+)\)", query)
+            return query_results([('$table', 'string'), ('IP', 'string'), ('SentinelBatchIndex', 'long')],
+                                 [[tbl, entity, int(index)] for tbl, entity, index in probes if self._has(tbl, entity)])
+        if 'search' in query:
+            tbl = re.match(r".*?; (\w+)", query).group(1)
+            entity = re.search(r"search '([^']+)'", query).group(1)
+            return query_results([('$table', 'string'), ('IP', 'string')],
+                                 [[tbl, entity]] if self._has(tbl, entity) else [])
+        if 'getschema' in query:
+            return query_results([('ColumnName', 'string')], [['c1'], ['c2']])
+        if 'dc0 = dcount' in query:
+            columns = re.findall(r"dc(\d+) = dcount\(\['(\w+)'\]\)", query)
+            return query_results([('dc' + i, 'long') for i, _ in columns] + [('count_', 'long')],
+                                 [[5 if col == 'c1' else 1 for _, col in columns] + [1000]])
+        if 'summarize dc =' in query:
+            return query_results([('ratio', 'real')], [[0.005]] if 'c1' in query else [])
+        raise ValueError('unexpected query ' + query[:60])
+
+    @staticmethod
+    def _has(tbl, entity):
+        return tbl != 'T3' and entity.startswith('1.')
+
+# end of the class
@@ -0,0 +1,223 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+test_anomaly_finder:
+This module tests AnomalyFinder against an in-process Log Analytics client.
+"""
+
+import builtins
+import json
+import random
+from collections import namedtuple
+
+import pandas as pd
+import pytest
+
+from SentinelAnomalyLookup.anomaly_finder import AnomalyFinder
+from SentinelAnomalyLookup.query_cache import QueryCache
+from SentinelUtils.query_result_decoder import QueryResultDecoder
+from fake_log_analytics import ANOMALY_COLUMNS, FakeLogAnalyticsClient, query_results
+
+# naive, as get_timewindow compares it with utcnow()
+Q_TIMESTAMP = '2020-01-01 00:00:00'
+Q_ENTITY = '1.2.3.4'
+
+Column = namedtuple('Column', ['name', 'type'])
+Table = namedtuple('Table', ['columns', 'rows'])
+
+
+def test_entity_column_skips_dynamic_columns():
+    """ a dynamic column decoded to dicts is never picked as the entity column """
+
+    # search puts the $table column first
+    table = Table(columns=[Column('$table', 'string'), Column('TimeGenerated', 'datetime'),
+                           Column('DeviceDetail', 'dynamic'), Column('UserPrincipalName', 'string')],
+                  rows=[['SigninLogs', '2021-01-05T03:04:05Z', json.dumps({'deviceId': 'a'}), 'alice@contoso.com'],
+                        ['SigninLogs', '2021-01-05T03:04:06Z', json.dumps({'deviceId': 'b'}), 'Alice@contoso.com']])
+    ent_in_table = QueryResultDecoder.to_dataframe(table)
+
+    assert AnomalyFinder._entity_column(ent_in_table, 'alice') == 'UserPrincipalName' # pylint: disable=protected-access
+
+
+def test_entity_column_not_found():
+    """ no column containing the entity gives an empty list """
+
+    table = Table(columns=[Column('$table', 'string'), Column('TimeGenerated', 'datetime'),
+                           Column('DeviceDetail', 'dynamic')],
+                  rows=[['SigninLogs', '2021-01-05T03:04:05Z', json.dumps({'deviceId': 'a'})]])
+    ent_in_table = QueryResultDecoder.to_dataframe(table)
+
+    assert AnomalyFinder._entity_column(ent_in_table, 'alice') == [] # pylint: disable=protected-access
+
+
+@pytest.fixture(autouse=True)
+def no_display(monkeypatch):
+    """ run shows its progress bar with the notebook display builtin """
+    monkeypatch.setattr(builtins, 'display', lambda *args, **kwargs: None, raising=False)
+
+
+def new_finder(client, **kwargs):
+    """ finder of a fake workspace with its own cache """
+    return AnomalyFinder('workspace', client, query_cache=QueryCache(), **kwargs)
+
+
+@pytest.mark.parametrize('max_workers', [1, 8])
+def test_run(max_workers):
+    """ the anomalies of the categorical column of the tables holding the entity, in table order """
+
+    anomalies, queries = new_finder(FakeLogAnalyticsClient(), max_workers=max_workers).run(Q_TIMESTAMP, Q_ENTITY, None)
+
+    assert anomalies.Table.tolist() == ['T1', 'T2']
+    assert anomalies.colName.tolist() == ['c1', 'c1']
+    assert 'T1' in queries and 'T2' in queries
+
+
+def test_run_reports_failed_tables(capsys):
+    """ a failing table is reported, the other tables are still searched """
+
+    finder = new_finder(FakeLogAnalyticsClient(fail_tables=['T2'], error=RuntimeError('T2 is gone')))
+    anomalies, _ = finder.run(Q_TIMESTAMP, Q_ENTITY, None)
+
+    assert anomalies.Table.tolist() == ['T1']
+    assert list(finder.table_errors) == ['T2']
+    assert 'T2: 1 failed, T2 is gone' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('batch', [False, True])
+def test_run_raises_when_every_probe_fails(batch):
+    """ an expired token is raised, not reported as no anomalies """
+
+    finder = new_finder(FakeLogAnalyticsClient(error=PermissionError('401 token expired')))
+    with pytest.raises(PermissionError):
+        if batch:
+            finder.run_batch([(Q_ENTITY, Q_TIMESTAMP)], FakeLogAnalyticsClient.TABLES)
+        else:
+            finder.run(Q_TIMESTAMP, Q_ENTITY, FakeLogAnalyticsClient.TABLES)
+
+
+def test_run_batch_matches_run():
+    """ run_batch finds the anomalies run finds for each pair """
+
+    pairs = [(Q_ENTITY, Q_TIMESTAMP), ('1.2.3.5', Q_TIMESTAMP), ('10.0.0.1', Q_TIMESTAMP)]
+    results = new_finder(FakeLogAnalyticsClient()).run_batch(pairs)
+    for q_entity, q_timestamp in pairs:
+        anomalies, _ = new_finder(FakeLogAnalyticsClient()).run(q_timestamp, q_entity, None)
+        assert results[(q_entity, q_timestamp)][0].reset_index(drop=True).equals(anomalies.reset_index(drop=True))
+
+
+def timewindow_cases():
+    """ (days, hours) holding the entity: single buckets, none, and random sets """
+
+    cases = [(day, None) for day in [None, -31, -30, -29, -10, -4, -3, -1, 0]]
+    cases += [(-2, hour) for hour in [None, -73, -72, -71, -30, -6, -5, -4]]
+    rng = random.Random(7)
+    for _ in range(40):
+        days = rng.sample(range(-32, 2), rng.randint(0, 4))
+        hours = rng.sample(range(-75, 0), rng.randint(0, 4))
+        cases.append((days, hours))
+    return cases
+
+
+@pytest.mark.parametrize('days, hours', timewindow_cases())
+def test_timewindow_searches_agree(days, hours):
+    """ bisect finds the time window of the linear bucket scan, in fewer queries when the scan is long """
+
+    windows = {}
+    counts = {}
+    for search in AnomalyFinder.TIMEWINDOW_SEARCHES:
+        finder = new_finder(FakeLogAnalyticsClient(first_day=days, first_hour=hours))
+        windows[search] = finder.get_timewindow(Q_ENTITY, Q_TIMESTAMP, 'IP', 'T1', search=search)
+        counts[search] = finder.table_query_counts['T1']
+
+    assert windows['bisect'] == windows['linear']
+    if counts['linear'] > 10:
+        assert counts['bisect'] < counts['linear']
+
+
+def baseline_related_queries(df_anomalies):
+    """ construct_related_queries as it was, row by row on the undecoded query result """
+
+    if df_anomalies.shape[0] == 0:
+        return None
+
+    queries = ''
+    for tbl in df_anomalies.Table.unique():
+
+        cur_table_anomalies = df_anomalies.loc[df_anomalies.Table == tbl, :]
+        query = """{tbl} \
+            | where TimeGenerated > datetime({maxTimestamp})-14d and TimeGenerated < datetime({maxTimestamp}) \
+            | where {entCol} has "{qEntity}" \
+            | where """.format(**{
+                'tbl': tbl,
+                'qTimestamp': cur_table_anomalies.qTimestamp.iloc[0],
+                'maxTimestamp': cur_table_anomalies.maxTimestamp.iloc[0],
+                'entCol': cur_table_anomalies.entCol.iloc[0],
+                'qEntity': cur_table_anomalies.qEntity.iloc[0]
+            })
+
+        for _, row in cur_table_anomalies.iterrows():
+            query += " {col} == to{colType}(\"{colVal}\") or".format(
+                col=row.colName,
+                colType=(row.colType) if 'colType' in row.keys() else 'string',
+                colVal=row.colVal.replace('"', '')
+            )
+
+        query = query[:-2] # drop the last or
+        query += " | take 1000; " # limit the output size
+        query = query.replace("\\", "\\\\")
+
+        queries += query
+    return queries
+
+
+def anomaly_rows(rng, count):
+    """ TIMESERIESANOMALYDETECTION result rows as Log Analytics returns them """
+
+    timestamps = ['2020-01-02T00:00:00Z', '2020-01-02T03:04:05.123Z', '2020-01-02T03:04:05.1234567Z',
+                  '2019-12-31T23:59:59.5Z']
+    rows = []
+    for _ in range(count):
+        tbl = rng.choice(['SigninLogs', 'AuditLogs', 'SecurityEvent'])
+        rows.append(['1.2.3.4', rng.choice(timestamps), rng.choice(timestamps), rng.choice(timestamps),
+                     '1.00:00:00', tbl, 'IPAddress', rng.choice(['AppId', 'Computer', 'EventID']),
+                     rng.choice(['app', 'say "hi"', 'C:\\Windows\\cmd.exe', '4624', '']),
+                     rng.choice(['string', 'long']), rng.random() * 10, rng.randint(0, 100), rng.random() * 5])
+    return rows
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_related_queries_match_baseline(seed):
+    """ the grouped query builder gives the text of the row by row one, on the decoded result """
+
+    rng = random.Random(seed)
+    rows = anomaly_rows(rng, rng.randint(1, 200))
+    raw = pd.DataFrame(rows, columns=[name for name, _ in ANOMALY_COLUMNS])
+    decoded = QueryResultDecoder.to_dataframe(query_results(ANOMALY_COLUMNS, rows).tables[0])
+
+    queries = AnomalyFinder.construct_related_queries(decoded)
+    assert queries == baseline_related_queries(raw)
+    assert ''.join(AnomalyFinder.construct_related_queries(decoded, as_list=True)) == queries
+
+
+def test_related_queries_text():
+    """ the query of each table """
+
+    rows = [['1.2.3.4', '2020-01-01T00:00:00Z', '2019-12-20T00:00:00Z', '2020-01-02T03:04:05.5Z', '1.00:00:00',
+             'SigninLogs', 'IPAddress', 'AppId', 'say "hi"', 'string', 1.5, 10, 3.2],
+            ['1.2.3.4', '2020-01-01T00:00:00Z', '2019-12-20T00:00:00Z', '2020-01-02T03:04:05.5Z', '1.00:00:00',
+             'SigninLogs', 'IPAddress', 'EventID', '4624', 'long', 1.5, 10, 3.2],
+            ['1.2.3.4', '2020-01-01T00:00:00Z', '2019-12-20T00:00:00Z', '2020-01-02T00:00:00Z', '1.00:00:00',
+             'SecurityEvent', 'IpAddress', 'Process', 'C:\\cmd.exe', 'string', 1.5, 10, 3.2]]
+    decoded = QueryResultDecoder.to_dataframe(query_results(ANOMALY_COLUMNS, rows).tables[0])
+
+    padding = ' ' * 12
+    assert AnomalyFinder.construct_related_queries(decoded, as_list=True) == [
+        'SigninLogs ' + padding + '| where TimeGenerated > datetime(2020-01-02T03:04:05.5Z)-14d'
+        ' and TimeGenerated < datetime(2020-01-02T03:04:05.5Z) ' + padding + '| where IPAddress has "1.2.3.4" '
+        + padding + '| where  AppId == tostring("say hi") or EventID == tolong("4624")  | take 1000; ',
+        'SecurityEvent ' + padding + '| where TimeGenerated > datetime(2020-01-02T00:00:00Z)-14d'
+        ' and TimeGenerated < datetime(2020-01-02T00:00:00Z) ' + padding + '| where IpAddress has "1.2.3.4" '
+        + padding + '| where  Process == tostring("C:\\\\cmd.exe")  | take 1000; ']
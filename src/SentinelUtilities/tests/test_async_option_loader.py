@@ -0,0 +1,80 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+test_async_option_loader:
+This module tests the result cache of AsyncOptionLoader.
+"""
+
+import gc
+import weakref
+
+from SentinelWidgets.async_option_loader import AsyncOptionLoader
+
+
+class Backend():
+    """ backend counting its list calls """
+
+    def __init__(self, names):
+        self.names = names
+        self.calls = 0
+
+    def get_names(self):
+        """ the names, counted """
+        self.calls += 1
+        return self.names
+
+
+class Widget(): # pylint: disable=too-few-public-methods
+    """ the widget attributes set by AsyncOptionLoader """
+
+    def __init__(self):
+        self.options = []
+        self.value = None
+        self.disabled = False
+
+
+def test_load_is_shared_per_backend():
+    """ one call per backend and key, backends never share results """
+
+    first, second = Backend(['a']), Backend(['b'])
+    assert AsyncOptionLoader.load(first, 'names', first.get_names).result() == ['a']
+    assert AsyncOptionLoader.load(first, 'names', first.get_names).result() == ['a']
+    assert AsyncOptionLoader.load(second, 'names', second.get_names).result() == ['b']
+    assert (first.calls, second.calls) == (1, 1)
+
+
+def test_collected_backend_is_dropped():
+    """ the cache does not keep a backend alive, a new backend gets its own results """
+
+    for number in range(20):
+        backend = Backend([number])
+        backend_ref = weakref.ref(backend)
+        assert AsyncOptionLoader.load(backend, 'names', backend.get_names).result() == [number]
+        del backend
+        gc.collect()
+        assert backend_ref() is None
+
+
+def test_results_expire(monkeypatch):
+    """ a result older than ttl is loaded again """
+
+    backend = Backend(['a'])
+    AsyncOptionLoader.load(backend, 'names', backend.get_names).result()
+    monkeypatch.setattr(AsyncOptionLoader, 'ttl', 0)
+    AsyncOptionLoader.load(backend, 'names', backend.get_names).result()
+    assert backend.calls == 2
+
+
+def test_fill_sets_options():
+    """ the widget gets the options and the first one selected """
+
+    backend = Backend(['a', 'b'])
+    widget = Widget()
+    # loaded first, so the options are applied within fill
+    AsyncOptionLoader.load(backend, 'names', backend.get_names).result()
+    AsyncOptionLoader.fill(widget, backend, 'names', backend.get_names)
+    assert (widget.options, widget.value, widget.disabled) == (['a', 'b'], 'a', False)
+    assert backend.calls == 1
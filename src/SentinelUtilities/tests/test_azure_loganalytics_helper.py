@@ -0,0 +1,69 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+test_azure_loganalytics_helper:
+This module tests the workspace index of LogAnalyticsHelper.
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from SentinelAzure.azure_loganalytics_helper import LogAnalyticsHelper
+from SentinelExceptions import InputError
+
+RESOURCE_ID = '/subscriptions/sub/resourceGroups/{0}/providers/Microsoft.OperationalInsights/workspaces/{1}'
+
+
+class FakeManagementClient(): # pylint: disable=too-few-public-methods
+    """ management client listing workspaces, counting the listings """
+
+    def __init__(self, workspaces):
+        self.listings = 0
+        self.workspaces = SimpleNamespace(list=self._list)
+        self._workspaces = workspaces
+
+    def _list(self):
+        self.listings += 1
+        return [SimpleNamespace(name=name, customer_id=customer_id, id=RESOURCE_ID.format(group, name), location='eastus')
+                for name, customer_id, group in self._workspaces]
+
+
+WORKSPACES = [('a', 'id-1', 'rg1'), ('a', 'id-2', 'rg2'), ('b', 'id-3', 'rg1')]
+
+
+def test_duplicated_names():
+    """ a duplicated name resolves to the first workspace listed, and is listed twice """
+
+    helper = LogAnalyticsHelper(FakeManagementClient(WORKSPACES))
+    assert helper.get_workspace_id('a') == 'id-1'
+    assert helper.get_workspace_name_list() == ['a', 'a', 'b']
+    assert helper.get_workspace('ID-2').resource_group == 'rg2'
+    assert helper.get_workspace(RESOURCE_ID.format('rg2', 'a')).customer_id == 'id-2'
+
+
+def test_index_is_reused():
+    """ the workspaces are listed once, and again for an unknown workspace """
+
+    client = FakeManagementClient(WORKSPACES)
+    helper = LogAnalyticsHelper(client)
+    helper.get_workspace_id('a')
+    helper.get_workspace_id('b')
+    assert client.listings == 1
+    with pytest.raises(InputError):
+        helper.get_workspace('c')
+    assert client.listings == 2
+
+
+def test_snapshot(tmp_path):
+    """ a fresh snapshot saves the listing of the next helper """
+
+    snapshot_path = str(tmp_path / 'workspaces.json')
+    LogAnalyticsHelper(FakeManagementClient(WORKSPACES), snapshot_path=snapshot_path).get_workspaces()
+    client = FakeManagementClient(WORKSPACES)
+    helper = LogAnalyticsHelper(client, snapshot_path=snapshot_path)
+    assert helper.get_workspace_id('a') == 'id-1'
+    assert client.listings == 0
@@ -0,0 +1,137 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+test_bookmark_helper:
+This module tests the bookmark payloads built by BookmarkModel.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import requests
+
+from SentinelPortal.bookmark_helper import BookmarkHelper, BookmarkModel, BookmarkProperties, _payload_time, _retry_after_seconds
+
+BOOKMARK_ID = '00000000-0000-0000-0000-000000000001'
+
+EXPECTED_PAYLOAD = """
+{
+    "etag": "*",
+    "id": "/subscriptions/sub/resourceGroups/rg/providers/Microsoft.OperationalInsights/workspaces/ws/providers/Microsoft.SecurityInsights/bookmarks/00000000-0000-0000-0000-000000000001",
+    "name": "bookmark",
+    "properties": {
+        "bookmarkId": "00000000-0000-0000-0000-000000000001",
+        "displayName": "display",
+        "eventTime": "2021-01-05T03:04:05+00:00",
+        "labels": [],
+        "query": "SigninLogs | take 1",
+        "queryEndTime": "2021-01-05T03:04:05.250000-05:00",
+        "queryResult": "{}",
+        "queryStartTime": "2021-01-05T03:04:05Z"
+    },
+    "type": "Microsoft.SecurityInsights/Bookmarks"
+}
+"""
+
+
+class ThrottledSession(): # pylint: disable=too-few-public-methods
+    """ session answering the first and third PUT with 429 and an HTTP date in Retry-After """
+
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method, url, **kwargs): # pylint: disable=unused-argument
+        """ the canned response """
+        self.calls += 1
+        response = requests.Response()
+        response.url = url
+        if self.calls in (1, 3):
+            response.status_code = 429
+            response.reason = 'Too Many Requests'
+            response.headers['Retry-After'] = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        else:
+            response.status_code = 200
+            response.reason = 'OK'
+        response._content = b'{}' # pylint: disable=protected-access
+        return response
+
+
+def new_bookmark(display_name):
+    """ bookmark model of the test workspace """
+    return BookmarkModel(display_name, 'sub', 'rg', 'ws', BookmarkProperties(display_name, 'SigninLogs | take 1'))
+
+
+@pytest.fixture
+def new_york_time(monkeypatch):
+    """ run the test with a local time zone west of UTC """
+    if not hasattr(time, 'tzset'):
+        pytest.skip('time.tzset is not available')
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_payload_times(new_york_time): # pylint: disable=redefined-outer-name, unused-argument
+    """ naive datetimes are written as UTC whatever the local time zone """
+
+    properties = BookmarkProperties('display', 'SigninLogs | take 1',
+                                    event_time=datetime(2021, 1, 5, 3, 4, 5),
+                                    query_start_time=datetime(2021, 1, 5, 3, 4, 5, tzinfo=timezone.utc),
+                                    query_end_time=datetime(2021, 1, 5, 3, 4, 5, 250000,
+                                                            tzinfo=timezone(timedelta(hours=-5))))
+    properties.bookmarkId = BOOKMARK_ID
+    model = BookmarkModel('bookmark', 'sub', 'rg', 'ws', properties)
+
+    assert model.to_payload() == json.loads(EXPECTED_PAYLOAD)
+
+
+@pytest.mark.parametrize('zone, month, expected', [('Europe/London', 1, '2020-01-02T00:00:00-00:00'),
+                                                   ('Europe/London', 7, '2020-07-02T00:00:00+01:00'),
+                                                   ('Africa/Abidjan', 1, '2020-01-02T00:00:00-00:00'),
+                                                   ('UTC', 1, '2020-01-02T00:00:00Z')])
+def test_payload_times_of_zones(zone, month, expected):
+    """ zones with a zero offset but another name than UTC are written as jsons wrote them """
+
+    zoneinfo = pytest.importorskip('zoneinfo')
+    assert _payload_time(datetime(2020, month, 2, tzinfo=zoneinfo.ZoneInfo(zone))) == expected
+
+
+def test_payload_times_of_fixed_zero_offset():
+    """ a fixed zero offset named GMT """
+    assert _payload_time(datetime(2020, 1, 2, tzinfo=timezone(timedelta(0), 'GMT'))) == '2020-01-02T00:00:00-00:00'
+
+
+@pytest.mark.parametrize('value, seconds', [(None, 1), ('3', 3.0), ('0.5', 0.5), ('-2', 0.0),
+                                            ('Wed, 21 Oct 2015 07:28:00 GMT', 0.0), ('soon', 1), ('inf', 1)])
+def test_retry_after_seconds(value, seconds):
+    """ Retry-After in seconds, as a past HTTP date, or unreadable """
+    assert _retry_after_seconds(value) == seconds
+
+
+def test_retry_after_future_date():
+    """ an HTTP date is counted from now """
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < _retry_after_seconds(retry_at.strftime('%a, %d %b %Y %H:%M:%S GMT')) <= 30
+
+
+def test_add_bookmarks_with_http_date_retry_after():
+    """ a 429 with an HTTP date Retry-After is reported per bookmark """
+
+    session = ThrottledSession()
+    helper = BookmarkHelper('token', session=session)
+    bookmarks = [new_bookmark('bookmark{0}'.format(i)) for i in range(4)]
+    results = helper.add_bookmarks(bookmarks, max_workers=1)
+
+    assert [result.status_code for result in results] == [429, 200, 429, 200]
+    assert [result.resource_id for result in results] == [bookmark.id for bookmark in bookmarks]
+
+    results = helper.add_bookmarks(bookmarks, max_workers=1, previous_results=results)
+    assert [result.status_code for result in results] == [200, 200, 200, 200]
+    assert session.calls == 6
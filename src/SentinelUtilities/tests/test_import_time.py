@@ -0,0 +1,63 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+test_import_time:
+This module checks that importing the packages stays cheap: the heavy dependencies are
+only imported when a member using them is accessed.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+PACKAGES = ['SentinelAnomalyLookup', 'SentinelAzure', 'SentinelExceptions', 'SentinelLog',
+            'SentinelPortal', 'SentinelUtils', 'SentinelWidgets']
+HEAVY_MODULES = {'applicationinsights', 'azure', 'cryptography', 'IPython', 'ipywidgets', 'msrest',
+                 'numpy', 'pandas', 'pkg_resources', 'requests'}
+# modules imported without the DataFrame stack, though they need some of the heavy ones
+LIGHT_MODULES = ['SentinelUtils.obfuscation_utility', 'SentinelLog.log']
+DATAFRAME_MODULES = {'numpy', 'pandas'}
+# pandas alone takes several times this
+IMPORT_BUDGET_SECONDS = 0.1
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(package):
+    """ cumulative seconds of each module imported by a fresh interpreter importing package, from -X importtime """
+
+    env = dict(os.environ, PYTHONPATH=PACKAGE_ROOT)
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + package],
+                               cwd=PACKAGE_ROOT, env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if fields[1].strip().isdigit():
+            times[fields[2].strip()] = int(fields[1]) / 1e6
+    return times
+
+
+@pytest.mark.parametrize('package', PACKAGES)
+def test_import_is_light(package):
+    """ the package import loads no heavy dependency and stays within the budget """
+
+    times = import_times(package)
+    heavy = sorted({name.split('.')[0] for name in times} & HEAVY_MODULES)
+    assert heavy == [], 'import {0} loads {1}'.format(package, ', '.join(heavy))
+    assert times[package] < IMPORT_BUDGET_SECONDS
+
+
+@pytest.mark.parametrize('module', LIGHT_MODULES)
+def test_module_import_skips_pandas(module):
+    """ modules used for text only do not load pandas """
+
+    loaded = sorted({name.split('.')[0] for name in import_times(module)} & DATAFRAME_MODULES)
+    assert loaded == [], 'import {0} loads {1}'.format(module, ', '.join(loaded))
@@ -0,0 +1,118 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+test_loganalytics_fanout:
+This module tests LogAnalyticsFanout against an in-process Log Analytics client.
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+from SentinelAzure.loganalytics_fanout import LogAnalyticsFanout
+from SentinelExceptions import InputError
+from fake_log_analytics import query_results
+
+
+class FakeFanoutClient():
+    """ answers one row per workspace after latency seconds, workspaces in failing raise """
+
+    def __init__(self, latency=0.0, failing=()):
+        self.latency = latency
+        self.failing = set(failing)
+        self.calls = []
+        self.max_in_flight = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def query(self, workspace_id, body): # pylint: disable=unused-argument
+        """ the row of a workspace """
+        with self._lock:
+            self.calls.append(workspace_id)
+            self._in_flight[workspace_id] = self._in_flight.get(workspace_id, 0) + 1
+            self.max_in_flight[workspace_id] = max(self.max_in_flight.get(workspace_id, 0), self._in_flight[workspace_id])
+        try:
+            time.sleep(self.latency)
+            if workspace_id in self.failing:
+                raise RuntimeError('403 forbidden')
+            return query_results([('Computer', 'string'), ('Count', 'long')], [['host-' + workspace_id, 1]])
+        finally:
+            with self._lock:
+                self._in_flight[workspace_id] -= 1
+
+
+class FakeHelper(): # pylint: disable=too-few-public-methods
+    """ the get_workspace of LogAnalyticsHelper, for workspaces named after their customer id """
+
+    def __init__(self, customer_ids):
+        self.customer_ids = customer_ids
+
+    def get_workspace(self, key):
+        """ the workspace named key """
+        if key not in self.customer_ids:
+            raise InputError(key)
+        return SimpleNamespace(name=key, customer_id=self.customer_ids[key])
+
+
+def test_rows_are_tagged():
+    """ each row carries its source workspace """
+
+    fanout = LogAnalyticsFanout(FakeFanoutClient())
+    merged = fanout.query('Heartbeat', ['w1', 'w2', 'w3'])
+
+    assert sorted(zip(merged.SourceWorkspace, merged.Computer)) == [('w1', 'host-w1'), ('w2', 'host-w2'), ('w3', 'host-w3')]
+
+
+def test_names_are_resolved():
+    """ with a helper, rows are tagged with the workspace name and queried by customer id """
+
+    client = FakeFanoutClient()
+    fanout = LogAnalyticsFanout(client, FakeHelper({'prod': 'id-1', 'test': 'id-2'}), workspace_column='Workspace')
+    merged = fanout.query('Heartbeat', ['prod', 'test'])
+
+    assert sorted(zip(merged.Workspace, merged.Computer)) == [('prod', 'host-id-1'), ('test', 'host-id-2')]
+    assert sorted(client.calls) == ['id-1', 'id-2']
+
+
+def test_stats_count_errors():
+    """ failed and unknown workspaces are skipped and counted in stats """
+
+    fanout = LogAnalyticsFanout(FakeFanoutClient(failing=['id-2']), FakeHelper({'prod': 'id-1', 'test': 'id-2'}))
+    merged = fanout.query('Heartbeat', ['prod', 'test', 'gone'])
+    stats = fanout.stats()
+
+    assert merged.SourceWorkspace.tolist() == ['prod']
+    assert stats.loc['id-1', ['queries', 'errors', 'rows']].tolist() == [1, 0, 1]
+    assert stats.loc['id-2', ['queries', 'errors', 'rows']].tolist() == [1, 1, 0]
+    assert stats.loc['id-2', 'last_error'] == '403 forbidden'
+    assert stats.loc['gone', ['errors', 'last_error']].tolist() == [1, 'unknown workspace']
+
+    fanout.reset_stats()
+    assert fanout.stats()['queries'].sum() == 0
+
+
+def test_per_workspace_limit():
+    """ queries of a workspace do not overlap with max_concurrent_per_workspace=1 """
+
+    client = FakeFanoutClient(latency=0.02)
+    LogAnalyticsFanout(client, max_workers=4).query('Heartbeat', ['w1', 'w1', 'w1', 'w2'])
+
+    assert client.max_in_flight == {'w1': 1, 'w2': 1}
+
+
+def test_close_cancels_pending_queries():
+    """ closing the generator early cancels the queries not yet started """
+
+    client = FakeFanoutClient(latency=0.05)
+    workspaces = ['w{0}'.format(i) for i in range(10)]
+    results = LogAnalyticsFanout(client, max_workers=1).iter_query('Heartbeat', workspaces)
+
+    workspace, _ = next(results)
+    results.close()
+    time.sleep(0.2)
+
+    assert workspace == 'w0'
+    assert len(client.calls) <= 2
@@ -0,0 +1,47 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+test_obfuscation_utility:
+This module tests the column obfuscation of ObfuscationUtility.
+"""
+
+import pandas as pd
+import pytest
+
+from SentinelUtils.obfuscation_utility import ObfuscationUtility
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_series_round_trip(monkeypatch, max_workers):
+    """ values come back, nulls are kept, equal values get equal tokens """
+
+    monkeypatch.setattr(ObfuscationUtility, 'PARALLEL_MIN_VALUES', 2)
+    utility = ObfuscationUtility(ObfuscationUtility.generate_seed())
+    series = pd.Series(['alice', None, 'bob', 'alice', 'carol'], name='user')
+
+    tokens = utility.obfuscate_series(series, max_workers)
+    assert tokens[0] == tokens[3] and tokens[0] != tokens[2]
+    assert tokens[1] is None
+    assert utility.deobfuscate_series(tokens, max_workers).tolist() == series.tolist()
+
+
+def test_dataframe_columns():
+    """ only the given columns are obfuscated, on a copy """
+
+    utility = ObfuscationUtility(ObfuscationUtility.generate_seed())
+    data_frame = pd.DataFrame({'user': ['alice', 'bob'], 'count': [1, 2]})
+
+    obfuscated = utility.obfuscate_dataframe(data_frame, ['user'])
+    assert obfuscated['count'].tolist() == [1, 2]
+    assert data_frame['user'].tolist() == ['alice', 'bob']
+    assert utility.deobfuscate_dataframe(obfuscated, ['user']).equals(data_frame)
+
+
+def test_text_round_trip():
+    """ the text methods are unchanged """
+
+    utility = ObfuscationUtility(ObfuscationUtility.generate_seed())
+    assert utility.deobfuscate_text(utility.obfuscate_text(b'secret')) == 'secret'
@@ -0,0 +1,130 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""
+test_query_cache:
+This module tests the QueryCache expiry, eviction, invalidation and disk store.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from SentinelAnomalyLookup import query_cache
+from SentinelAnomalyLookup.query_cache import QueryCache
+
+SCHEMA = pd.DataFrame({'ColumnName': ['TimeGenerated', 'Computer', 'EventID'],
+                       'ColumnOrdinal': [0, 1, 2],
+                       'DataType': ['System.DateTime', 'System.String', 'System.Int32']})
+
+
+@pytest.fixture(name='clock')
+def fixture_clock(monkeypatch):
+    """ a settable time.time for the cache module """
+
+    now = [1000000.0]
+    monkeypatch.setattr(query_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_hit_and_miss_counters():
+    """ each get counts as a hit or a miss, and hits are copies """
+
+    cache = QueryCache()
+    assert cache.get('w1', 'T | getschema') is None
+    cache.put('w1', 'T | getschema', SCHEMA)
+    cached = cache.get('w1', 'T | getschema')
+    cached.loc[0, 'ColumnName'] = 'changed'
+
+    pd.testing.assert_frame_equal(cache.get('w1', 'T | getschema'), SCHEMA)
+    assert cache.get('w2', 'T | getschema') is None
+    assert cache.stats() == {'hits': 2, 'misses': 2, 'entries': 1}
+
+
+def test_entries_expire(clock):
+    """ an entry is served for ttl seconds """
+
+    cache = QueryCache(ttl=60)
+    cache.put('w1', 'q', SCHEMA)
+    clock[0] += 59
+    assert cache.get('w1', 'q') is not None
+    clock[0] += 2
+    assert cache.get('w1', 'q') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'entries': 0}
+
+
+def test_least_recently_used_is_evicted():
+    """ past max_entries, the entry used longest ago goes first """
+
+    cache = QueryCache(max_entries=2)
+    cache.put('w1', 'q1', SCHEMA)
+    cache.put('w1', 'q2', SCHEMA)
+    cache.get('w1', 'q1')
+    cache.put('w1', 'q3', SCHEMA)
+
+    assert cache.get('w1', 'q2') is None
+    assert cache.get('w1', 'q1') is not None
+    assert cache.get('w1', 'q3') is not None
+    assert cache.stats()['entries'] == 2
+
+
+@pytest.mark.parametrize('use_disk', [False, True])
+def test_invalidate(tmp_path, use_disk):
+    """ one query, one workspace or everything, in memory and on disk """
+
+    cache = QueryCache(cache_dir=str(tmp_path) if use_disk else None)
+    for workspace_id in ['w1', 'w2']:
+        for query in ['q1', 'q2']:
+            cache.put(workspace_id, query, SCHEMA)
+
+    def cached():
+        reloaded = QueryCache(cache_dir=cache.cache_dir) if use_disk else cache
+        return sorted((workspace_id, query) for workspace_id in ['w1', 'w2'] for query in ['q1', 'q2']
+                      if reloaded.get(workspace_id, query) is not None)
+
+    cache.invalidate('w1', 'q1')
+    assert cached() == [('w1', 'q2'), ('w2', 'q1'), ('w2', 'q2')]
+    cache.invalidate('w2')
+    assert cached() == [('w1', 'q2')]
+    cache.invalidate()
+    assert cached() == []
+
+
+def test_disk_store_survives_a_new_cache(tmp_path):
+    """ a new instance on the same cache_dir serves the stored entries """
+
+    frame = SCHEMA.assign(Seen=pd.to_datetime(['2020-01-01T00:00:00.123456Z'] * 3, utc=True),
+                          Score=[1.5, None, 3.0], Required=[True, False, True])
+    QueryCache(cache_dir=str(tmp_path)).put('w1', 'T | getschema', frame)
+
+    cache = QueryCache(cache_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(cache.get('w1', 'T | getschema'), frame)
+    assert cache.stats() == {'hits': 1, 'misses': 0, 'entries': 1}
+    # the disk store holds JSON, nothing which runs code when read
+    assert os.listdir(os.path.join(str(tmp_path), 'w1')) == [QueryCache.make_key('w1', 'T | getschema')[1] + '.json']
+
+
+def test_disk_entries_expire(tmp_path):
+    """ disk entries older than ttl are not loaded """
+
+    QueryCache(cache_dir=str(tmp_path)).put('w1', 'q', SCHEMA)
+    path = QueryCache(cache_dir=str(tmp_path))._disk_path(QueryCache.make_key('w1', 'q')) # pylint: disable=protected-access
+    os.utime(path, (os.path.getmtime(path) - 120,) * 2)
+
+    assert QueryCache(ttl=60, cache_dir=str(tmp_path)).get('w1', 'q') is None
+    assert QueryCache(ttl=600, cache_dir=str(tmp_path)).get('w1', 'q') is not None
+
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path):
+    """ a truncated or foreign file in cache_dir is ignored """
+
+    cache = QueryCache(cache_dir=str(tmp_path))
+    cache.put('w1', 'q', SCHEMA)
+    path = cache._disk_path(QueryCache.make_key('w1', 'q')) # pylint: disable=protected-access
+    with open(path, 'w') as file:
+        file.write('{"schema": {"fields": [')
+
+    assert QueryCache(cache_dir=str(tmp_path)).get('w1', 'q') is None
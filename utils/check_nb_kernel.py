@@ -27,6 +27,15 @@ optional arguments:
                         Required for 'update' command
   --verbose, -v         Show details of all checked notebooks. Otherwise
                         only list notebooks with errors or updated notebooks.
+  --workers WORKERS, -w WORKERS
+                        Number of processes reading notebooks.
+                        Defaults to the number of CPUs.
+  --cache CACHE         JSON file caching the kernelspec of each notebook.
+                        Notebooks with unchanged size and modification time
+                        are not read again.
+  --timing              Report the time spent reading each notebook.
+  --metadata-only       Parse only the notebook metadata, notebooks with
+                        invalid JSON in their cells are not reported.
 
 Notes
 -----
@@ -39,14 +48,31 @@ with kernelspecs different to internal kernelspecs
 (you can view the built-in kernelspecs with 'list' command)
 as errors.
 
+Notebooks are parsed as JSON, without the nbformat schema validation,
+so notebooks which are not valid JSON are reported as errors.
+With --metadata-only, only the notebook metadata is parsed: it is located
+in the tail of the file (nbformat writes it after the cells), falling
+back to a streaming parse with ijson (if installed) and then to
+reading the whole file.
+
 """
 import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Optional, Tuple
 import sys
 
 import nbformat
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 
 IP_KERNEL_SPEC = {
     "python36": {
@@ -79,21 +105,204 @@ IP_KERNEL_SPEC = {
 
 _LEGAL_KERNELS = ["azureml_38", "papermill", ".net-csharp", ".net-powershell", "azureml_310"]
 
+_TAIL_BYTES = 64 * 1024
+_NB_TAIL_RGX = re.compile(r'(\s*,\s*"nbformat(_minor)?"\s*:\s*\d+)*\s*\}\s*$')
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _metadata_from_tail(text: str) -> Optional[dict]:
+    """Return the top-level metadata object found in the tail of a notebook."""
+    pos = len(text)
+    while True:
+        pos = text.rfind('"metadata"', 0, pos)
+        if pos < 0:
+            return None
+        colon = text.find(":", pos + len('"metadata"'))
+        start = colon + 1 if colon >= 0 else -1
+        while 0 < start < len(text) and text[start].isspace():
+            start += 1
+        if start > 0 and text.startswith("{", start):
+            try:
+                metadata, end = _JSON_DECODER.raw_decode(text, start)
+            except ValueError:
+                metadata = None
+            if isinstance(metadata, dict) and _NB_TAIL_RGX.match(text, end):
+                return metadata
+
+
+def _kernelspec_of_json(text) -> Optional[dict]:
+    """Return the kernelspec of a notebook JSON text or bytes."""
+    nb_obj = json.loads(text)
+    if not isinstance(nb_obj, dict):
+        raise ValueError("Notebook does not contain a JSON object")
+    return nb_obj.get("metadata", {}).get("kernelspec", None)
+
+
+def read_kernelspec(nbook: Path, metadata_only: bool = False) -> Optional[dict]:
+    """
+    Read the kernelspec of a notebook.
+
+    The whole notebook is parsed as JSON, or with `metadata_only`
+    only its metadata, without parsing the cells.
+
+    Raises ValueError if the notebook (or with `metadata_only`,
+    its metadata) is not valid JSON.
+
+    """
+    if not metadata_only:
+        with open(str(nbook), "rb") as nb_file:
+            return _kernelspec_of_json(nb_file.read())
+
+    size = nbook.stat().st_size
+    tail_bytes = _TAIL_BYTES
+    with open(str(nbook), "rb") as nb_file:
+        while True:
+            nb_file.seek(max(0, size - tail_bytes))
+            text = nb_file.read().decode("utf-8", errors="replace")
+            metadata = _metadata_from_tail(text)
+            if metadata is not None:
+                return metadata.get("kernelspec")
+            if tail_bytes >= size or tail_bytes >= 16 * _TAIL_BYTES:
+                break
+            tail_bytes *= 4
+
+        nb_file.seek(0)
+        if ijson is not None:
+            try:
+                for kernelspec in ijson.items(nb_file, "metadata.kernelspec"):
+                    return kernelspec
+                return None
+            except ijson.JSONError as err:
+                raise ValueError(str(err)) from err
+        return _kernelspec_of_json(nb_file.read())
+
+
+def _read_kernelspec_timed(
+    nbook: Path, metadata_only: bool = False
+) -> Tuple[Optional[dict], Optional[str], float]:
+    """Return kernelspec, error message and read time of a notebook."""
+    start = time.perf_counter()
+    try:
+        kernelspec = read_kernelspec(nbook, metadata_only)
+        error = None
+    except (OSError, ValueError) as err:
+        kernelspec = None
+        error = str(err)
+    return kernelspec, error, time.perf_counter() - start
+
+
+def _load_cache(cache_path: Optional[str]) -> Dict[str, list]:
+    if not cache_path:
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache_path: Optional[str], cache: Dict[str, list]):
+    if not cache_path:
+        return
+    with open(cache_path, "w", encoding="utf-8") as cache_file:
+        json.dump(cache, cache_file, indent=1, sort_keys=True)
+
+
+def scan_kernelspecs(
+    nb_path: str,
+    workers: Optional[int] = None,
+    cache_path: Optional[str] = None,
+    timing: bool = False,
+    metadata_only: bool = False,
+):
+    """
+    Read the kernelspecs of the notebooks matching `nb_path`.
+
+    Notebooks are read in a pool of `workers` processes. With `cache_path`,
+    notebooks whose size and modification time are unchanged are not read,
+    unless they were cached by a `metadata_only` scan and this one is not.
+    Returns a list of (notebook path, kernelspec, error message) in path order.
+
+    """
+    nbooks = sorted(
+        nbook
+        for nbook in _get_notebook_paths(nb_path)
+        if ".ipynb_checkpoints" not in str(nbook)
+    )
+    cache = _load_cache(cache_path)
+    results = {}
+    to_read = []
+    for nbook in nbooks:
+        stat = nbook.stat()
+        cached = cache.get(str(nbook))
+        if (
+            cached
+            and cached[0] == stat.st_mtime_ns
+            and cached[1] == stat.st_size
+            and (metadata_only or (len(cached) > 3 and cached[3]))
+        ):
+            results[nbook] = (cached[2], None, 0.0)
+        else:
+            to_read.append((nbook, stat))
+
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers > 1 and len(to_read) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            read_results = list(
+                executor.map(
+                    _read_kernelspec_timed,
+                    [nbook for nbook, _ in to_read],
+                    [metadata_only] * len(to_read),
+                    chunksize=max(1, len(to_read) // (workers * 4)),
+                )
+            )
+    else:
+        read_results = [
+            _read_kernelspec_timed(nbook, metadata_only) for nbook, _ in to_read
+        ]
+    elapsed = time.perf_counter() - start
+
+    for (nbook, stat), result in zip(to_read, read_results):
+        results[nbook] = result
+        if result[1] is None:
+            cache[str(nbook)] = [
+                stat.st_mtime_ns, stat.st_size, result[0], not metadata_only
+            ]
+    _save_cache(cache_path, cache)
+
+    if timing:
+        print(f"Read {len(to_read)} notebooks in {elapsed:.3f}s,", end=" ")
+        print(f"{len(nbooks) - len(to_read)} unchanged notebooks skipped")
+        for nbook, (_, _, seconds) in sorted(
+            ((nbook, results[nbook]) for nbook, _ in to_read),
+            key=lambda item: item[1][2],
+            reverse=True,
+        ):
+            print(f"  {seconds * 1000:8.1f} ms  {nbook}")
+        print()
+    return [(nbook, results[nbook][0], results[nbook][1]) for nbook in nbooks]
+
 
-def check_notebooks(nb_path: str, k_tgts: Iterable[str], verbose: bool = False):
+def check_notebooks(
+    nb_path: str,
+    k_tgts: Iterable[str],
+    verbose: bool = False,
+    workers: Optional[int] = None,
+    cache_path: Optional[str] = None,
+    timing: bool = False,
+    metadata_only: bool = False,
+):
     """Check notebooks for valid kernelspec."""
     err_count = 0
     good_count = 0
-    for nbook in _get_notebook_paths(nb_path):
-        if ".ipynb_checkpoints" in str(nbook):
+    for nbook, kernelspec, error in scan_kernelspecs(
+        nb_path, workers, cache_path, timing, metadata_only
+    ):
+        if error is not None:
+            print(f"Error reading {nbook}\n{error}")
+            err_count += 1
             continue
-        try:
-        	nb_obj = nbformat.read(str(nbook), as_version=4.0)
-        except nbformat.reader.NotJSONError as err:
-        	print(f"Error reading {nbook}\n{err}")
-        	err_count += 1
-        	continue
-        kernelspec = nb_obj.get("metadata", {}).get("kernelspec", None)
         if not kernelspec:
             print("Error: no kernel information.")
             continue
@@ -137,27 +346,41 @@ def _print_nb_header(nbook_path):
     print(str(nbook_path.resolve()))
 
 
-def set_kernelspec(nb_path: str, k_tgt: str, verbose: bool = False):
-    """Update specified notebooks to `k_tgt` kernelspec."""
+def set_kernelspec(
+    nb_path: str,
+    k_tgt: str,
+    verbose: bool = False,
+    workers: Optional[int] = None,
+    cache_path: Optional[str] = None,
+    timing: bool = False,
+    metadata_only: bool = False,
+):
+    """
+    Update specified notebooks to `k_tgt` kernelspec.
+
+    Only the notebooks needing an update are read with nbformat.
+
+    """
     changed_count = 0
     good_count = 0
-    for nbook in _get_notebook_paths(nb_path):
-        if ".ipynb_checkpoints" in str(nbook):
+    tgt_spec = IP_KERNEL_SPEC[k_tgt]
+    for nbook, kernelspec, error in scan_kernelspecs(
+        nb_path, workers, cache_path, timing, metadata_only
+    ):
+        if error is not None:
+            print(f"Error reading {nbook}\n{error}")
             continue
-        with open(str(nbook), "r") as nb_read:
-            nb_obj = nbformat.read(nb_read, as_version=4.0)
-        kernelspec = nb_obj.get("metadata", {}).get("kernelspec", None)
-        current_kspec_name = kernelspec.get("name")
         if not kernelspec:
             print("Error: no kernel information.")
             continue
-        updated = False
-        tgt_spec = IP_KERNEL_SPEC[k_tgt]
-        for k_name, k_item in kernelspec.items():
-            if tgt_spec[k_name] != k_item:
-                updated = True
-                kernelspec[k_name] = tgt_spec[k_name]
+        current_kspec_name = kernelspec.get("name")
+        updated = any(tgt_spec[k_name] != k_item for k_name, k_item in kernelspec.items())
         if updated:
+            with open(str(nbook), "r") as nb_read:
+                nb_obj = nbformat.read(nb_read, as_version=4.0)
+            kernelspec = nb_obj.get("metadata", {}).get("kernelspec", None)
+            for k_name in kernelspec:
+                kernelspec[k_name] = tgt_spec[k_name]
             changed_count += 1
             _print_nb_header(nbook)
             print(
@@ -196,6 +419,29 @@ def _add_script_args():
         action="store_true",
         help="Show details of all checked notebooks.",
     )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=None,
+        help="Number of processes reading notebooks (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--cache",
+        default=None,
+        required=False,
+        help="JSON file caching kernelspecs of unchanged notebooks.",
+    )
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        help="Report the time spent reading each notebook.",
+    )
+    parser.add_argument(
+        "--metadata-only",
+        action="store_true",
+        help="Parse only the notebook metadata, skipping the JSON check of the cells.",
+    )
     return parser
 
 
@@ -231,7 +477,15 @@ if __name__ == "__main__":
         print("check and update commands need a 'path' parameter.")
         sys.exit(1)
     if args.cmd == "check":
-        ok_count, err_count = check_notebooks(args.path, krnl_tgts, verbose=args.verbose)
+        ok_count, err_count = check_notebooks(
+            args.path,
+            krnl_tgts,
+            verbose=args.verbose,
+            workers=args.workers,
+            cache_path=args.cache,
+            timing=args.timing,
+            metadata_only=args.metadata_only,
+        )
         if err_count:
             sys.exit(1)
         sys.exit(0)
@@ -246,5 +500,13 @@ if __name__ == "__main__":
         if not krnl_tgt:
             print("A kernel target must be specified with 'update'.")
             sys.exit(1)
-        set_kernelspec(args.path, krnl_tgt, verbose=args.verbose)
+        set_kernelspec(
+            args.path,
+            krnl_tgt,
+            verbose=args.verbose,
+            workers=args.workers,
+            cache_path=args.cache,
+            timing=args.timing,
+            metadata_only=args.metadata_only,
+        )
         sys.exit(0)
@@ -4,6 +4,7 @@
 # license information.
 # --------------------------------------------------------------------------
 """Checker for Python and msticpy versions."""
+import hashlib
 import importlib
 import json
 import os
@@ -16,7 +17,21 @@ from urllib import request
 
 from IPython import get_ipython
 from IPython.display import HTML, display
-from pkg_resources import parse_version
+
+try:
+    from packaging.requirements import InvalidRequirement, Requirement
+    from packaging.version import parse as parse_version
+except ImportError:
+    Requirement = None
+    from pkg_resources import parse_version
+
+try:
+    from importlib import metadata as importlib_metadata
+except ImportError:
+    try:
+        import importlib_metadata
+    except ImportError:
+        importlib_metadata = None
 
 __version__ = "2.0.0"
 
@@ -59,6 +74,10 @@ NB_CHECK_URI = (
 
 _IN_AML = os.environ.get("APPSETTING_WEBSITE_SITE_NAME") == "AMLComputeInstance"
 
+CHECK_CACHE_ENV_VAR = "NB_CHECK_CACHE"
+CHECK_CACHE_FILE = Path.home().joinpath(".msticpy", "nb_check_cache.json")
+CHECK_CACHE_MAX_ENTRIES = 20
+
 
 def check_versions(
     min_py_ver=MIN_PYTHON_VER_DEF,
@@ -158,17 +177,42 @@ def _check_mp_install(min_mp_ver, mp_release, extras, pip_quiet):
     mp_install_version = mp_release or os.environ.get("MP_TEST_VER", str(pkg_version))
     exact_version = bool(mp_release or os.environ.get("MP_TEST_VER"))
 
+    fingerprint = _env_fingerprint(mp_install_version, exact_version, extras)
+    if _is_cached_check(fingerprint) and _has_required_mp(
+        mp_install_version, exact_version
+    ):
+        _disp_html(
+            f"Info: msticpy {mp_install_version} and extras checked previously"
+            " in this environment OK<br>"
+        )
+        return
+
     try:
         check_mp_ver(min_msticpy_ver=mp_install_version)
-        if extras:
-            # If any extras are specified, always trigger an install
-            _disp_html("Running install to ensure extras are installed...<br>")
+        missing_extras = _missing_extras_reqs(extras) if extras else []
+        pinned_ok = _has_required_mp(mp_install_version, exact_version)
+        if missing_extras or not pinned_ok:
+            if missing_extras:
+                _disp_html(
+                    "Missing or outdated packages for msticpy extras: "
+                    f"{', '.join(missing_extras)}<br>"
+                )
+            if not pinned_ok:
+                _disp_html(
+                    f"msticpy {_installed_version('msticpy')} is installed,"
+                    f" msticpy=={mp_install_version} was requested<br>"
+                )
             _install_mp(
                 mp_install_version=mp_install_version,
                 exact_version=exact_version,
                 extras=extras,
                 quiet=pip_quiet,
             )
+            importlib.invalidate_caches()
+            missing_extras = _missing_extras_reqs(extras) if extras else []
+            pinned_ok = _has_required_mp(mp_install_version, exact_version)
+        if not missing_extras and pinned_ok:
+            _cache_check(_env_fingerprint(mp_install_version, exact_version, extras))
     except ImportError:
         _install_mp(
             mp_install_version=mp_install_version,
@@ -176,6 +220,7 @@ def _check_mp_install(min_mp_ver, mp_release, extras, pip_quiet):
             extras=extras,
             quiet=pip_quiet,
         )
+        importlib.invalidate_caches()
         _disp_html("Installation completed. Attempting to re-import/reload MSTICPy...")
         # pylint: disable=unused-import, import-outside-toplevel
         if "msticpy" in sys.modules:
@@ -187,10 +232,139 @@ def _check_mp_install(min_mp_ver, mp_release, extras, pip_quiet):
             import msticpy
         # pylint: enable=unused-import, import-outside-toplevel
         check_mp_ver(min_msticpy_ver=mp_install_version)
+        if _has_required_mp(mp_install_version, exact_version):
+            _cache_check(
+                _env_fingerprint(mp_install_version, exact_version, extras)
+            )
     except RuntimeError:
         _disp_html("Installation skipped.")
 
 
+def _installed_version(dist_name):
+    """
+    Return the installed version of a distribution without importing it.
+
+    Returns None if it is not installed. Falls back to importing
+    the package when importlib.metadata is not available (Python 3.7
+    without the importlib_metadata backport).
+
+    """
+    if importlib_metadata is not None:
+        try:
+            return importlib_metadata.version(dist_name)
+        except importlib_metadata.PackageNotFoundError:
+            return None
+    try:
+        return importlib.import_module(dist_name).__version__
+    except (ImportError, AttributeError):
+        return None
+
+
+def _has_required_mp(mp_install_version, exact_version):
+    """
+    Return True unless an exact msticpy version is requested and not installed.
+
+    check_mp_ver only checks for a minimum version, a newer msticpy
+    must not stand in for a pinned release.
+
+    """
+    if not exact_version:
+        return True
+    inst_version = _installed_version("msticpy")
+    return inst_version is not None and _get_pkg_version(
+        inst_version
+    ) == _get_pkg_version(mp_install_version)
+
+
+def _missing_extras_reqs(extras, dist_name="msticpy"):
+    """
+    Return the requirements of the msticpy extras that are not satisfied.
+
+    Each requirement declared for one of the extras is checked against
+    the installed distributions. If the requirements cannot be read,
+    the extras are reported as missing so that pip is run.
+
+    """
+    if Requirement is None or importlib_metadata is None:
+        return [f"{dist_name}[{','.join(extras)}]"]
+    try:
+        dist_reqs = importlib_metadata.requires(dist_name) or []
+    except importlib_metadata.PackageNotFoundError:
+        return [f"{dist_name}[{','.join(extras)}]"]
+
+    missing = []
+    for req_str in dist_reqs:
+        try:
+            req = Requirement(req_str)
+        except InvalidRequirement:
+            continue
+        if not req.marker or not any(
+            req.marker.evaluate({"extra": extra}) for extra in extras
+        ):
+            continue
+        inst_version = _installed_version(req.name)
+        if inst_version is None or not req.specifier.contains(
+            inst_version, prereleases=True
+        ):
+            missing.append(str(req))
+    return missing
+
+
+def _env_fingerprint(mp_install_version, exact_version, extras):
+    """
+    Return a hash identifying this check in the current environment.
+
+    It covers the interpreter, the requested msticpy version and extras,
+    and the installed msticpy version and modification times of the
+    package folders, so that installs and upgrades invalidate it.
+
+    """
+    site_dirs = sorted(
+        {path for path in sys.path if path and os.path.isdir(path)}
+    )
+    parts = [
+        sys.executable,
+        sys.version,
+        str(mp_install_version),
+        str(exact_version),
+        ",".join(sorted(extras or [])),
+        str(_installed_version("msticpy")),
+    ]
+    parts.extend(f"{path}:{os.stat(path).st_mtime_ns}" for path in site_dirs)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _check_cache_path():
+    return Path(os.environ.get(CHECK_CACHE_ENV_VAR, str(CHECK_CACHE_FILE)))
+
+
+def _read_check_cache():
+    try:
+        with open(_check_cache_path(), "r", encoding="utf-8") as cache_file:
+            entries = json.load(cache_file)
+        return entries if isinstance(entries, list) else []
+    except (OSError, ValueError):
+        return []
+
+
+def _is_cached_check(fingerprint):
+    """Return True if this check already succeeded in the same environment."""
+    return fingerprint in _read_check_cache()
+
+
+def _cache_check(fingerprint):
+    """Record a successful check, the cache is best effort."""
+    entries = [entry for entry in _read_check_cache() if entry != fingerprint]
+    entries = (entries + [fingerprint])[-CHECK_CACHE_MAX_ENTRIES:]
+    cache_path = _check_cache_path()
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as cache_file:
+            json.dump(entries, cache_file)
+    except OSError:
+        pass
+
+
 # pylint: disable=import-outside-toplevel
 def check_mp_ver(min_msticpy_ver=MSTICPY_REQ_VERSION):
     """
@@ -217,9 +391,11 @@ def check_mp_ver(min_msticpy_ver=MSTICPY_REQ_VERSION):
     wrong_ver_err = f"msticpy {mp_min_pkg_ver} or later is needed."
     inst_version = "none"
     try:
-        import msticpy
+        mp_version = _installed_version("msticpy")
+        if mp_version is None:
+            raise ImportError("msticpy is not installed")
 
-        inst_version = _get_pkg_version(msticpy.__version__)
+        inst_version = _get_pkg_version(mp_version)
         if inst_version < mp_min_pkg_ver:
             raise ImportError(wrong_ver_err)
 
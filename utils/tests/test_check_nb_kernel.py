@@ -0,0 +1,128 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""Tests of the notebook kernelspec reader of check_nb_kernel."""
+import json
+
+import nbformat
+import pytest
+
+from utils import check_nb_kernel
+
+KERNELSPEC = check_nb_kernel.IP_KERNEL_SPEC["azureml_310"]
+
+
+def write_notebook(path, cell_count=3, widget_bytes=0):
+    """Write a notebook as nbformat does, with cell metadata and optional widget state."""
+    nb_obj = nbformat.v4.new_notebook()
+    nb_obj.cells = [
+        nbformat.v4.new_code_cell(f"print({i})", metadata={"tags": ["metadata"]})
+        for i in range(cell_count)
+    ]
+    nb_obj.metadata["kernelspec"] = dict(KERNELSPEC)
+    if widget_bytes:
+        nb_obj.metadata["widgets"] = {"state": "x" * widget_bytes}
+    nbformat.write(nb_obj, str(path))
+    return path
+
+
+def test_metadata_from_tail_skips_cell_metadata():
+    """Only the top-level metadata, followed by the nbformat keys, is returned."""
+    text = json.dumps(
+        {
+            "cells": [{"metadata": {"kernelspec": "cell"}, "source": []}],
+            "metadata": {"kernelspec": KERNELSPEC},
+            "nbformat": 4,
+            "nbformat_minor": 5,
+        },
+        indent=1,
+    )
+    assert check_nb_kernel._metadata_from_tail(text) == {"kernelspec": KERNELSPEC}
+    # the tail of a file cut within the top-level metadata
+    assert check_nb_kernel._metadata_from_tail(text[: text.rfind('"metadata"')]) is None
+
+
+@pytest.mark.parametrize("metadata_only", [False, True])
+def test_read_kernelspec(tmp_path, metadata_only):
+    """The kernelspec is read with and without parsing the cells."""
+    nbook = write_notebook(tmp_path / "nb.ipynb")
+    assert check_nb_kernel.read_kernelspec(nbook, metadata_only) == KERNELSPEC
+
+
+def test_read_kernelspec_large_metadata(tmp_path):
+    """The tail read grows for metadata larger than the first window."""
+    nbook = write_notebook(
+        tmp_path / "nb.ipynb", widget_bytes=3 * check_nb_kernel._TAIL_BYTES
+    )
+    assert check_nb_kernel.read_kernelspec(nbook, metadata_only=True) == KERNELSPEC
+
+
+def test_corrupted_cells_are_errors(tmp_path):
+    """A notebook with a merge conflict in its cells is reported unless metadata_only."""
+    nbook = write_notebook(tmp_path / "nb.ipynb")
+    text = nbook.read_text(encoding="utf-8")
+    nbook.write_text(
+        text.replace('"print(1)"', '<<<<<<< HEAD\n"print(1)"', 1), encoding="utf-8"
+    )
+
+    with pytest.raises(ValueError):
+        check_nb_kernel.read_kernelspec(nbook)
+    assert check_nb_kernel.read_kernelspec(nbook, metadata_only=True) == KERNELSPEC
+
+    good, errors = check_nb_kernel.check_notebooks(str(nbook), ["azureml_310"], workers=1)
+    assert (good, errors) == (0, 1)
+
+
+@pytest.mark.parametrize("with_ijson", [False, True])
+def test_read_kernelspec_fallback(tmp_path, monkeypatch, with_ijson):
+    """Metadata written before the cells is found by ijson, or by reading the whole file."""
+    if with_ijson:
+        pytest.importorskip("ijson")
+    else:
+        monkeypatch.setattr(check_nb_kernel, "ijson", None)
+    nbook = tmp_path / "nb.ipynb"
+    nbook.write_text(
+        json.dumps(
+            {
+                "metadata": {"kernelspec": KERNELSPEC},
+                "nbformat": 4,
+                "nbformat_minor": 5,
+                "cells": [],
+            }
+        ),
+        encoding="utf-8",
+    )
+    assert check_nb_kernel.read_kernelspec(nbook, metadata_only=True) == KERNELSPEC
+
+
+def test_scan_cache(tmp_path, monkeypatch):
+    """Unchanged notebooks are not read again, metadata-only entries do not skip the JSON check."""
+    nbook = write_notebook(tmp_path / "nb.ipynb")
+    cache_path = str(tmp_path / "cache.json")
+    reads = []
+
+    def read_kernelspec(nbook, metadata_only=False):
+        reads.append(metadata_only)
+        return dict(KERNELSPEC)
+
+    monkeypatch.setattr(check_nb_kernel, "read_kernelspec", read_kernelspec)
+
+    def scan(metadata_only):
+        return check_nb_kernel.scan_kernelspecs(
+            str(nbook), workers=1, cache_path=cache_path, metadata_only=metadata_only
+        )
+
+    assert scan(True) == [(nbook, KERNELSPEC, None)]
+    assert scan(True) == [(nbook, KERNELSPEC, None)]
+    assert reads == [True]
+
+    scan(False)
+    scan(False)
+    scan(True)
+    assert reads == [True, False]
+
+    write_notebook(nbook, cell_count=4)
+    scan(False)
+    assert reads == [True, False, False]
@@ -0,0 +1,59 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""Tests of the msticpy install check in nb_check."""
+import pytest
+
+from utils import nb_check
+
+
+@pytest.fixture
+def mp_env(monkeypatch, tmp_path):
+    """Installed msticpy 2.1.0 with a pip install that installs the pinned version."""
+    env = {"msticpy": "2.1.0", "installs": []}
+
+    def install_mp(mp_install_version, exact_version, extras, quiet=True):
+        env["installs"].append((mp_install_version, exact_version))
+        env["msticpy"] = mp_install_version
+
+    monkeypatch.setenv(nb_check.CHECK_CACHE_ENV_VAR, str(tmp_path / "check.json"))
+    monkeypatch.delenv("MP_TEST_VER", raising=False)
+    monkeypatch.setattr(nb_check, "_installed_version", env.get)
+    monkeypatch.setattr(nb_check, "_install_mp", install_mp)
+    monkeypatch.setattr(nb_check, "_disp_html", lambda text: None)
+    return env
+
+
+def test_newer_version_meets_minimum(mp_env):
+    """A newer msticpy satisfies a minimum version without pip."""
+    nb_check._check_mp_install((2, 0, 0), None, None, True)
+    nb_check._check_mp_install((2, 0, 0), None, None, True)
+    assert mp_env["installs"] == []
+
+
+def test_newer_version_does_not_skip_pinned_release(mp_env):
+    """A pinned release is installed over a newer msticpy, then cached."""
+    nb_check._check_mp_install((2, 0, 0), "2.0.0", None, True)
+    assert mp_env["installs"] == [("2.0.0", True)]
+
+    nb_check._check_mp_install((2, 0, 0), "2.0.0", None, True)
+    assert mp_env["installs"] == [("2.0.0", True)]
+
+
+def test_newer_version_does_not_skip_test_version(mp_env, monkeypatch):
+    """MP_TEST_VER pins the version too."""
+    monkeypatch.setenv("MP_TEST_VER", "2.0.0")
+    nb_check._check_mp_install((2, 0, 0), None, None, True)
+    assert mp_env["installs"] == [("2.0.0", True)]
+
+
+def test_failed_pinned_install_is_not_cached(mp_env, monkeypatch):
+    """A pinned install that did not take effect is checked again next time."""
+    monkeypatch.setattr(
+        nb_check, "_install_mp", lambda **kwargs: mp_env["installs"].append(kwargs)
+    )
+    nb_check._check_mp_install((2, 0, 0), "2.0.0", None, True)
+    nb_check._check_mp_install((2, 0, 0), "2.0.0", None, True)
+    assert len(mp_env["installs"]) == 2